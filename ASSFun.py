@@ -1,24 +1,48 @@
 from pathlib import Path
-from tkinterdnd2 import TkinterDnD, DND_ALL
-import customtkinter as ctk
-import tkinter
 import re, json
 from functools import partial
 import os, sys
 import shutil
-from fontTools.ttLib import TTFont, TTCollection
+from fontTools.ttLib import TTFont, newTable
 from fontTools import subset
 import random
-from PIL import Image
 import requests, subprocess
-import io, threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import io, threading, time, copy
+import concurrent.futures
+import mmap, struct
+import sqlite3, hashlib
+from contextlib import closing, nullcontext
+from typing import Iterable, Iterator, NamedTuple
+import multiprocessing
 from pymediainfo import MediaInfo
+import argparse, traceback
 
+# 使用 --cli 以命令行模式运行时不载入图形界面（可以在没有图形环境的服务器上运行）
+HEADLESS = "--cli" in sys.argv[1:]
 
-class Tk(ctk.CTk, TkinterDnD.DnDWrapper):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.TkdndVersion = TkinterDnD._require(self)
+if not HEADLESS:
+    from tkinterdnd2 import TkinterDnD, DND_ALL
+    import customtkinter as ctk
+    import tkinter
+    from PIL import Image
+
+    class Tk(ctk.CTk, TkinterDnD.DnDWrapper):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.TkdndVersion = TkinterDnD._require(self)
+
+else:
+    # 图形界面的类仍然会定义，但不会使用，基类用空的类代替
+    class _HeadlessCTk:
+        def __getattr__(self, name):
+            return type(name, (), {})
+
+    ctk = _HeadlessCTk()
+
+    class Tk:
+        pass
 
 
 def hex_to_rgb(hex_color):
@@ -47,6 +71,249 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+# 字体缓存格式版本，格式变化时旧缓存会被丢弃
+CACHE_VERSION = 3
+
+# 字幕字体收集结果缓存的版本，收集规则变化时旧缓存会被丢弃
+ASSCACHE_VERSION = 2
+
+
+def getName(names, nameID, platformID, platEncID, langID=None):
+    namerecords = []
+    for namerecord in names.names:
+        if (
+            namerecord.nameID == nameID
+            and namerecord.platformID == platformID
+            and namerecord.platEncID == platEncID
+        ):
+            if langID is None or namerecord.langID == langID:
+                namerecords.append(namerecord)
+    return namerecords
+
+
+# 只读取 sfnt 表目录和 name、OS/2 表，不载入整个字体（大型 ttc 也只读取很少的数据）
+# 返回每个 face 的 (name 表, 字重, 是否斜体)，缺少 name 表的 face 为 (None, 400, False)
+def readfacetables(font_path: str) -> list[tuple]:
+    with open(font_path, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        if data[:4] == b"ttcf":
+            (numfonts,) = struct.unpack(">I", data[8:12])
+            offsets = struct.unpack(f">{numfonts}I", data[12 : 12 + 4 * numfonts])
+        elif data[:4] in (b"\x00\x01\x00\x00", b"OTTO", b"true"):
+            offsets = (0,)
+        else:  # woff 等其他格式交给 fontTools 处理
+            font = TTFont(font_path, lazy=True)
+            table = font["name"] if "name" in font else None
+            weight, italic = 400, False
+            if "OS/2" in font:
+                weight = font["OS/2"].usWeightClass
+                italic = bool(font["OS/2"].fsSelection & 1)
+            font.close()
+            return [(table, weight, italic)]
+        faces = []
+        for offset in offsets:
+            (numtables,) = struct.unpack(">H", data[offset + 4 : offset + 6])
+            table, weight, italic = None, 400, False
+            for index in range(numtables):
+                record = offset + 12 + 16 * index
+                tag, _, tableoffset, length = struct.unpack(
+                    ">4sIII", data[record : record + 16]
+                )
+                if tag == b"name":
+                    table = newTable("name")
+                    table.decompile(data[tableoffset : tableoffset + length], None)
+                elif tag == b"OS/2" and length >= 64:
+                    (weight,) = struct.unpack(
+                        ">H", data[tableoffset + 4 : tableoffset + 6]
+                    )
+                    (fsselection,) = struct.unpack(
+                        ">H", data[tableoffset + 62 : tableoffset + 64]
+                    )
+                    italic = bool(fsselection & 1)
+            faces.append((table, weight, italic))
+        return faces
+
+
+# 读取字体文件中每个字体（ttc 中的每个 face）的名称、字重及是否斜体
+def getfontfaces(font_path: str) -> list[dict]:
+    faces = []
+    for names, weight, italic in readfacetables(font_path):
+        if names is None:
+            faces.append({"names": [], "weight": weight, "italic": italic})
+            continue
+        names = [
+            name.toStr()
+            for name in [
+                *getName(names, 1, 3, 1),
+                *getName(names, 4, 3, 1),
+                *getName(names, 1, 1, 25),
+                *getName(names, 4, 3, 25),
+            ]
+            if name is not None
+        ]
+        faces.append(
+            {
+                "names": sorted({name for name in names if name is not None}),
+                "weight": weight,
+                "italic": italic,
+            }
+        )
+    return faces
+
+
+# 当前用户及系统的字体文件夹（用户字体优先）
+def getsystemfontdirs() -> list[str]:
+    if sys.platform == "win32":
+        return [
+            os.path.join(
+                os.environ.get("LOCALAPPDATA", ""), "Microsoft", "Windows", "Fonts"
+            ),
+            os.path.join(os.environ.get("SystemRoot", "C:\\"), "Fonts"),
+        ]
+    if sys.platform == "darwin":
+        return [
+            os.path.expanduser("~/Library/Fonts"),
+            "/Library/Fonts",
+            "/System/Library/Fonts",
+        ]
+    return [
+        os.path.expanduser("~/.local/share/fonts"),
+        os.path.expanduser("~/.fonts"),
+        "/usr/local/share/fonts",
+        "/usr/share/fonts",
+    ]
+
+
+# 字体文件夹的签名（所有子文件夹的修改时间），文件夹中增删字体时会变化
+def getdirsignature(font_dir: str) -> str:
+    digest = hashlib.sha1()
+    for root, dirs, _ in os.walk(font_dir):
+        dirs.sort()
+        digest.update(f"{root}\0{os.stat(root).st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+# 字体名称的索引键（字幕中的字体名称不区分大小写）
+def normalizefontname(fontname: str) -> str:
+    return fontname.strip().casefold()
+
+
+# 由字体缓存生成 字体名称 -> [字体文件, face, 字重, 是否斜体] 的索引
+# 同名的字体按 常规字重 > 非斜体 > 路径 > face 的顺序排列，第一个即为查找结果
+def buildfontindex(cache: dict) -> dict[str, list[list]]:
+    fontindex = {}
+    for font_path, entry in cache.items():
+        for face, info in enumerate(entry["faces"]):
+            for name in info["names"]:
+                fontindex.setdefault(normalizefontname(name), []).append(
+                    [font_path, face, info["weight"], info["italic"]]
+                )
+    for entries in fontindex.values():
+        entries.sort(key=lambda x: (abs(x[2] - 400), x[3], x[0], x[1]))
+    return fontindex
+
+
+# 字体附件的 MIME 类型
+FONT_MIME_TYPES = {
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+    ".ttc": "font/collection",
+    ".woff2": "font/woff2",
+}
+
+
+# 子集化设置（同时作为子集化结果缓存的键的一部分）
+SUBSET_OPTIONS = {"name_languages": "*"}
+
+
+# 子集化字体的名称，由原字体（名称、文件名、大小及 face）和字符决定，不受字体路径影响
+def subsetname(fontname: str, fontfile: str, face: int, characters: str) -> str:
+    key = [
+        fontname,
+        os.path.basename(fontfile),
+        os.path.getsize(fontfile),
+        face,
+        "".join(sorted(set(characters))),
+    ]
+    key = json.dumps(key, ensure_ascii=False)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+# 子集化字体（在子进程中运行，只使用参数）
+# 输出路径不带扩展名，扩展名按实际格式决定，返回实际的输出路径
+def subsetfont(
+    fontfile: str,
+    face: int,
+    characters: str,
+    newname: str,
+    outputpath: str,
+    flavor: str = "ttf",
+    threshold: int = 0,
+) -> str:
+    subsetoptions = subset.Options(
+        **SUBSET_OPTIONS,
+        font_number=face,  # ttc 直接读取缓存中记录的 face
+        recalc_timestamp=False,  # 保持原来的时间戳，相同的输入得到相同的字体文件
+    )
+    font = subset.load_font(fontfile, options=subsetoptions)  # 读取字体
+
+    # 子集化字体
+    subsetter = subset.Subsetter(options=subsetoptions)
+    subsetter.populate(text=characters)
+    subsetter.subset(font)
+
+    # 修改字体名称
+    name_table = font["name"]
+    for record in name_table.names:
+        if record.nameID == 1:
+            record.string = newname.encode("utf-16be")
+        elif record.nameID == 4:
+            record.string = newname.encode("utf-16be")
+
+    # 保存：ttf/otf 不压缩速度快，woff2 体积小但压缩很慢
+    # auto 时先按 ttf/otf 输出，超过阈值再压缩为 woff2
+    ext = ".otf" if "CFF " in font or "CFF2" in font else ".ttf"
+    if flavor == "auto":
+        data = io.BytesIO()
+        subset.save_font(font, data, subset.Options())
+        flavor = "woff2" if len(data.getvalue()) > threshold else "ttf"
+    if flavor == "woff2":
+        ext = ".woff2"
+        subset.save_font(font, f"{outputpath}{ext}", subset.Options(flavor="woff2"))
+    else:
+        subset.save_font(font, f"{outputpath}{ext}", subset.Options())
+    font.close()
+    return f"{outputpath}{ext}"
+
+
+# 按最近使用时间（修改时间）清理缓存文件夹，同名不同扩展名的文件视为同一项缓存
+# 返回删除的缓存数量
+def trimcache(cache_dir: Path, maxsize: float) -> int:
+    if not os.path.exists(cache_dir):
+        return 0
+    entries = {}
+    for file in os.scandir(cache_dir):
+        stat = file.stat()
+        key = os.path.splitext(file.name)[0]
+        size, mtime, paths = entries.get(key, (0, 0, []))
+        entries[key] = (
+            size + stat.st_size,
+            max(mtime, stat.st_mtime),
+            paths + [file.path],
+        )
+    total = sum(size for size, _, _ in entries.values())
+    removed = 0
+    for size, _, paths in sorted(entries.values(), key=lambda x: x[1]):
+        if total <= maxsize:
+            break
+        for path in paths:
+            os.remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
 # 开关
 class Check(ctk.CTkFrame):
     def __init__(self, master, key: str, label: str, default: bool = False):
@@ -246,6 +513,9 @@ class ConfigWindowFrame(ctk.CTkScrollableFrame):
             "generate_cht_styles": "繁化只对此设置项指定的样式生效\n用,分割，留空则全部生效",
             "generate_cht_keep_comment": "开启后对于一些不显示的行(例如翻译注释)不进行繁化",
             "zhconvert_json": "生成繁中字幕时请求 繁化姬 的 json 数据\n使用{ASSCONTENT}来表示字幕内容",
+            "zhconvert_compact": "繁化时只发送需要繁化的字幕行(去重)，再按行号填回\n请求更小更快，繁化姬增减行数时也不会错位",
+            "zhconvertcache": "是否缓存繁化结果，请求内容(字幕及设置)不变时不再请求繁化姬",
+            "zhconvertcache_size": "繁化结果缓存的最大容量(MB)，超过时删除最久未使用的缓存",
             "generate_jpn": "生成字幕时是否生成日语字幕",
             "jpn_convert": "在生成日语字幕时是否删除所有中文行",
             "jpn_convert_styles_to_delete": "在生成日语字幕时删除的中文行的指定样式\n可删除多个样式及其内容，用,分割",
@@ -255,6 +525,30 @@ class ConfigWindowFrame(ctk.CTkScrollableFrame):
             "aegisub_cli_loglevel": "aegisub-cli 的 loglevel\n0 = exception; 1 = assert; 2 = warning; 3 = info; 4 = debug",
             "generate_language": "生成字幕及原始文件名中的语言标识\n用,分割，即：简中标识,繁中标识,日语标识",
             # "assstyles": "生成多样式字幕所需要用到的样式表\n请查看说明填写此项或者关闭字幕多样式生成",
+            "font_dirs": "额外的字体文件夹，用,分割\n例如共享的字体文件夹，每个文件夹单独缓存",
+            "font_system_dirs": "是否使用系统及用户的字体文件夹",
+            "font_project_dirname": "字幕同目录下的字体文件夹名称，其中的字体优先使用\n留空则不使用",
+            "fontcache_format": "字体缓存的保存格式(sqlite或json)\nsqlite启动时不需要载入全部缓存，json格式的缓存会自动迁移",
+            "fontcache_parallel": "读取字体时是否使用多进程并行读取",
+            "fontcache_workers": "并行读取字体的进程数(0则为CPU核心数)",
+            "fontcache_timeout": "并行读取时单个字体文件的超时时间(秒)",
+            "subset_parallel": "子集化时是否使用多进程同时处理多个字体",
+            "subset_workers": "同时子集化字体的进程数(0则为CPU核心数)",
+            "subsetcache": "是否缓存子集化结果，字体及字符不变时直接使用缓存",
+            "subsetcache_size": "子集化结果缓存的最大容量(MB)，超过时删除最久未使用的缓存",
+            "subset_flavor": "子集化字体的输出格式\nttf = 不压缩(ttf/otf，速度快)；woff2 = 压缩(体积小但很慢)；auto = 超过阈值时压缩",
+            "subset_flavor_threshold": "输出格式为auto时，超过此大小(KB)的字体压缩为woff2",
+            "asscollect_parallel": "收集字幕字体时是否使用多进程同时处理多个字幕文件",
+            "asscollect_workers": "同时处理字幕文件的进程数(0则为CPU核心数)",
+            "asscache": "是否缓存每个字幕的字体收集结果，字幕内容不变时直接使用缓存",
+            "asscache_size": "字体收集结果缓存最多保留的字幕数，超过时删除最久未使用的缓存",
+            "batch_workers": "命令行批量处理时同时处理的集数(0则为CPU核心数)",
+            "batch_sharedsubset": "批量处理时整季共用子集化字体\n收集全部剧集的字符，每个字体只子集化一次并使用固定的名称",
+            "http_connect_timeout": "繁化姬请求的连接超时时间(秒)",
+            "http_read_timeout": "繁化姬请求的读取超时时间(秒)",
+            "http_retries": "繁化姬请求失败(429或5xx)时的最大重试次数",
+            "http_backoff": "重试的退避系数(秒)，每次重试的等待时间翻倍",
+            "http_concurrency": "同时进行的繁化姬请求数，批量处理时避免触发限流",
             "proxy": "http代理端口，0则为禁用",
         }
         row = 0
@@ -454,6 +748,61 @@ class SelectWindow(ctk.CTkToplevel):
         return self.result
 
 
+# 内存中的字幕文件，各阶段共用同一份内容，lines 保留每行的换行符
+class ASSDocument(NamedTuple):
+    path: Path
+    lines: list[str]
+
+    # 读取字幕文件
+    @classmethod
+    def read(cls, path: Path) -> "ASSDocument":
+        with open(path, "r", encoding="utf-8-sig") as file:
+            return cls(Path(path), file.readlines())
+
+    # 由生成的字幕内容创建（不写入文件）
+    @classmethod
+    def fromstring(cls, path: Path, content: str) -> "ASSDocument":
+        return cls(Path(path), io.StringIO(content).readlines())
+
+    # 内容的哈希，用作字体收集结果缓存的键
+    def digest(self) -> str:
+        return hashlib.sha1("".join(self.lines).encode("utf-8")).hexdigest()
+
+    # 写入文件
+    def save(self, outputpath: Path):
+        with open(outputpath, "w", encoding="utf-8-sig") as file:
+            file.writelines(self.lines)
+
+
+# 字幕各节的位置索引：{小写的节名: (节开始, 正文开始, 节结束)}
+# 节从节标题行开始，到下一个节标题行之前（最后一节到文件末尾）为止，同名的节只记录第一个
+def indexsections(content: str) -> dict[str, tuple[int, int, int]]:
+    starts = [0] if content.startswith("[") else []
+    index = content.find("\n[")
+    while index >= 0:
+        starts.append(index + 1)
+        index = content.find("\n[", index + 1)
+    headers = []
+    for start in starts:
+        lineend = content.find("\n", start)
+        if lineend < 0:
+            lineend = len(content)
+        if content[start:lineend].rstrip().endswith("]"):  # 以 [ 开头的普通行不是节标题
+            headers.append((start, lineend))
+    sections = {}
+    ends = [start for start, _ in headers[1:]] + [len(content)]
+    for (start, lineend), end in zip(headers, ends):
+        name = content[start + 1 : content.find("]", start)].lower()
+        sections.setdefault(name, (start, min(lineend + 1, end), end))
+    return sections
+
+
+# 重复的空格
+ASS_SPACES = re.compile(r" {2,}")
+# 字幕中的 Unicode 码点，例如 \u{3000}
+ASS_UNICODE_ESCAPE = re.compile(r"\\u\{([0-9a-fA-F]+)\}")
+
+
 class ASSGenerate:
     def __init__(self, master):
         self.assoriginal_filename = ""
@@ -465,8 +814,8 @@ class ASSGenerate:
         self.asschss = []
         self.asschts = []
         self.assjpns = []
-        self.master: ASSFunUI = master
-        self.results: list[Path] = []
+        self.master: ASSFun = master
+        self.results: list[ASSDocument] = []
 
     # 读取字幕文件
     def readfile(self, assfile: Path):
@@ -480,30 +829,37 @@ class ASSGenerate:
         with open(assfile, "r", encoding="utf-8-sig") as file:
             self.assengoriginal = file.read()
 
-    # 清理 Script Info
+    # 清理 Script Info（只处理 Script Info 一节，其余部分原样保留）
     def clean_scriptinfo(self, content: str, language: str = "") -> str:
         _clean_scriptinfo = self.master.getconfig("clean_scriptinfo")
+        span = indexsections(content).get("script info")
+        if span is None:
+            if not _clean_scriptinfo:
+                self.master.log("跳过 Script Info 清理")
+            return content
+        start, _, end = span
+        section = content[start:end]
         zhconvertcomment = re.search(
             r"^(Comment\: Processed by 繁化姬.+)$",
-            content,
+            section,
             flags=re.MULTILINE,
         )  # 繁化姬注释
         if zhconvertcomment:
             zhconvertcomment = re.sub(
                 r"@[^\|]+", "", zhconvertcomment.group(1)
             )  # 去掉时间信息
-        content = re.sub(
-            r"^Comment\: Processed by 繁化姬.*\n", "", content, flags=re.MULTILINE
+        section = re.sub(
+            r"^Comment\: Processed by 繁化姬.*\n", "", section, flags=re.MULTILINE
         )
         if not _clean_scriptinfo:
             self.master.log("跳过 Script Info 清理")
             if zhconvertcomment:
-                content = re.sub(
+                section = re.sub(
                     r"\[Script Info\]",
                     f"[Script Info]\n{zhconvertcomment}",
-                    content,
+                    section,
                 )  # 重新加上繁化姬注释
-            return content
+            return content[:start] + section + content[end:]
         scriptinfo = self.master.getconfig("scriptinfo")
         if "{LANGUAGE}" in scriptinfo:
             scriptinfo_language: str = self.master.getconfig("scriptinfo_language")
@@ -515,19 +871,14 @@ class ASSGenerate:
             elif "JPN" in language.upper():
                 language = scriptinfo_language[2]
             scriptinfo = re.sub(r"\{LANGUAGE\}", language, scriptinfo)
-        content = re.sub(
-            r"\[Script Info\][\s\S\n]+?\n(?=\[)",
-            f"{scriptinfo}\n\n",
-            content,
-            flags=re.IGNORECASE,
-        )
+        section = f"{scriptinfo}\n\n"
         if zhconvertcomment:
-            content = re.sub(
+            section = re.sub(
                 r"\[Script Info\]",
                 f"[Script Info]\n{zhconvertcomment}",
-                content,
+                section,
             )  # 重新加上繁化姬注释
-        return content
+        return content[:start] + section + content[end:]
 
     # 清除 Aegisub Project Garbage 信息
     def clean_garbage(self, content: str) -> str:
@@ -535,62 +886,109 @@ class ASSGenerate:
         if not _clean_garbage:
             self.master.log("跳过 Aegisub Project Garbage 清理")
             return content
-        content = re.sub(
-            r"\[Aegisub Project Garbage\][\s\S\n]+?\n(?=\[)",
-            "",
+        span = indexsections(content).get("aegisub project garbage")
+        if span is not None:
+            start, _, end = span
+            content = content[:start] + content[end:]
+        return content
+
+    # 逐行清理字幕，每行依次经过 cleaners 中的各项处理（返回 None 时删除该行）
+    # 开启的清理项在同一次遍历中完成
+    def clean_lines(self, content: str, cleaners: list) -> str:
+        cleaners = [cleaner for cleaner in cleaners if cleaner is not None]
+        if len(cleaners) == 0:
+            return content
+        lines = []
+        for line in content.split("\n"):
+            for cleaner in cleaners:
+                line = cleaner(line)
+                if line is None:
+                    break
+            else:
+                lines.append(line)
+        return "\n".join(lines)
+
+    # 清除未使用的 furigana 样式、无效空格并将 Unicode 码点转换为 UTF-8 字节
+    def clean_content(self, content: str) -> str:
+        return self.clean_lines(
             content,
-            flags=re.IGNORECASE,
+            [
+                self.furiganacleaner(content),
+                self.spacecleaner(),
+                self.unicodecleaner(),
+            ],
         )
-        return content
 
     # 清除未使用的 furigana 样式
     def clean_furigana(self, content: str) -> str:
+        return self.clean_lines(content, [self.furiganacleaner(content)])
+
+    # 删除未使用的 furigana 样式行，事先收集 Events 中所有字幕行用到的样式
+    def furiganacleaner(self, content: str):
         _clean_furigana = self.master.getconfig("clean_furigana")
         if not _clean_furigana:
             self.master.log("跳过 furigana 清理")
-            return content
-        furiganastyles = re.findall(
-            r"Style: ?([^,]+?-furigana),", content, re.MULTILINE
-        )
-        for furiganastyle in furiganastyles:
-            match = re.match(f"Dialogue:.*{furiganastyle}", content)
-            if match is None:
-                content = re.sub(r"Style: ?[^,]+?-furigana.+\n", "", content)
-        return content
-
-    # 清除无效空格
-    def clean_space(self, content: str) -> str:
+            return None
+        usedstyles = set()
+        span = indexsections(content).get("events")
+        if span is not None:
+            for record in iterass(content[span[0] : span[2]].split("\n")):
+                if isinstance(record, ASSDialogue):
+                    usedstyles.add(record.style)
+
+        def cleaner(line: str) -> str | None:
+            if line.startswith("Style:"):
+                stylename = line[6:].removeprefix(" ").split(",", 1)[0]
+                if stylename.endswith("-furigana") and stylename not in usedstyles:
+                    return None
+            return line
+
+        return cleaner
+
+    # 清除行末空格（以及所有重复空格）
+    def spacecleaner(self):
         _clean_space = self.master.getconfig("clean_space")
         if not _clean_space:
             self.master.log("跳过空格清理")
-            return content
-        content = re.sub(r" +$", "", content, flags=re.MULTILINE)  # 清除行末空格
+            return None
         _clean_all_space = self.master.getconfig("clean_all_space")
-        if _clean_all_space:
-            content = re.sub(
-                r" +", " ", content, flags=re.MULTILINE
-            )  # 清除所有重复空格
-        return content
 
-    # Unicode码点转UTF-8字节
-    def unicode_to_utf8(self, content: str) -> str:
+        def cleaner(line: str) -> str:
+            line = line.rstrip(" ")  # 清除行末空格
+            if _clean_all_space and "  " in line:
+                line = ASS_SPACES.sub(" ", line)  # 清除所有重复空格
+            return line
+
+        return cleaner
+
+    # Unicode码点转UTF-8字节，例如 \u{3000} 转换为 \xE3\x80\x80
+    def unicodecleaner(self):
         _unicode_to_utf8 = self.master.getconfig("unicode_to_utf8")
         if not _unicode_to_utf8:
             self.master.log("跳过Unicode码点转UTF-8字节")
-            return content
-        unicodes = re.findall(r"\\u\{([0-9a-fA-F]+)\}", content, re.MULTILINE)
-        for unicode in unicodes:
-            utf8 = "".join(
-                f"\\\\x{byte:02X}" for byte in eval(f"'\\u{unicode}'").encode("utf-8")
-            )
-            content = re.sub(r"\\u\{[0-9a-fA-F]+\}", utf8, content)
-        return content
+            return None
+
+        def toutf8(match: re.Match) -> str:
+            try:
+                utf8 = chr(int(match.group(1), 16)).encode("utf-8")
+            except ValueError:  # 超出范围的码点保持原样
+                return match.group(0)
+            return "".join(f"\\x{byte:02X}" for byte in utf8)
+
+        def cleaner(line: str) -> str:
+            if "\\u{" not in line:
+                return line
+            return ASS_UNICODE_ESCAPE.sub(toutf8, line)
+
+        return cleaner
 
     # 获取 style 名
     def getstyle(self, content: str) -> str | None:
-        stylestring = re.search(
-            r"^(Style:[\s\S\n]+?)\n(?=\[)", content, re.MULTILINE
-        ).group(1)
+        sections = indexsections(content)
+        span = sections.get("v4+ styles") or sections.get("v4 styles")
+        if span is None:
+            return None
+        stylestring = content[span[1] : span[2]]
         assstyles = self.master.getconfig("assstyles")
         for _, _assstyles in assstyles.items():
             for assstyle, assstylestring in _assstyles.items():
@@ -613,24 +1011,23 @@ class ASSGenerate:
         elif "JPN" in lang.upper():
             lang = "JPN"
         stylestring += assstyles[lang][style]
+        span = indexsections(content).get("v4+ styles")
+        if span is None:
+            return content
+        start, _, end = span
+        section = content[start:end]
         optional_styles: str = self.master.getconfig("optional_styles")
         optional_styles = optional_styles.split(",")
         for optional_style in optional_styles:
             _stylestring = re.search(
                 f"^(Style: ?{re.escape(optional_style)},.+?)$",
-                content,
+                section,
                 flags=re.MULTILINE,
             )
             if _stylestring:
                 stylestring += f"\n{_stylestring.group(1)}"
         stylestring += "\n\n"
-        content = re.sub(
-            r"^\[V4\+ Styles\][\s\S\n]+?\n(?=\[)",
-            f"{stylestring}\n",
-            content,
-            flags=re.MULTILINE,
-        )
-        return content
+        return content[:start] + f"{stylestring}\n" + content[end:]
 
     # 保存简中信息
     def chsconfirm(self):
@@ -642,6 +1039,132 @@ class ASSGenerate:
         if not generate_cht:
             self.master.log("跳过繁化")
             return
+        if self.master.getconfig("zhconvert_compact"):
+            self.zhconvert_compact()
+            return
+        self.assoriginal_cht = self.requestzhconvert(self.assoriginal)
+        self.assoriginal_cht = self.clean_scriptinfo(self.assoriginal_cht, "CHT_JPN")
+
+        _, chs_body, chs_end = indexsections(self.assoriginal)["events"]
+        _, cht_body, cht_end = indexsections(self.assoriginal_cht)["events"]
+        chs_lines = self.assoriginal[chs_body:chs_end].split("\n")
+        cht_lines = self.assoriginal_cht[cht_body:cht_end].split("\n")
+        chs_lines = [x for x in chs_lines if x.strip()]
+        cht_lines = [x for x in cht_lines if x.strip()]
+        format = next(x for x in chs_lines if x.startswith("Format:"))
+        keepchs = self.chskeeper(format)
+        for index, _ in enumerate(chs_lines):
+            if keepchs(chs_lines[index], cht_lines[index]):
+                cht_lines[index] = chs_lines[index]
+        cht_lines = "\n".join(cht_lines)
+        cht_lines = f"{cht_lines}\n"
+        if cht_end < len(self.assoriginal_cht):
+            cht_lines += "\n"  # 与后面的节之间保留空行
+        self.assoriginal_cht = (
+            self.assoriginal_cht[:cht_body] + cht_lines + self.assoriginal_cht[cht_end:]
+        )
+
+        self.asschts.append(self.assoriginal_cht)
+
+    # 判断繁化时是否保持简中原样的行（generate_cht_styles 及 generate_cht_keep_comment 设置）
+    def chskeeper(self, format: str):
+        generate_cht_styles: str = self.master.getconfig("generate_cht_styles")
+        generate_cht_styles = generate_cht_styles.split(",")
+        generate_cht_keep_comment = self.master.getconfig("generate_cht_keep_comment")
+
+        def keepchs(chs_line: str, cht_line: str) -> bool:
+            if len(generate_cht_styles) > 0:
+                _stylename = self.master.get_assformat_by_key(format, chs_line, "Name")
+                if _stylename in generate_cht_styles:
+                    return True
+            if generate_cht_keep_comment:
+                if (
+                    cht_line.startswith("Comment:")
+                    and self.master.get_assformat_by_key(
+                        format, chs_line, "Effect"
+                    ).lower()
+                    != "karaoke"
+                ):
+                    return True
+            return False
+
+        return keepchs
+
+    # 精简繁化：只发送需要繁化的字幕行（去重），按行号将结果填回简中字幕
+    # 请求中的字幕行用 Name 列记录行号，繁化姬增减行数时也能对应
+    def zhconvert_compact(self):
+        content = self.assoriginal
+        _, body, end = indexsections(content)["events"]
+        lines = content[body:end].split("\n")
+        format = next(x for x in lines if x.startswith("Format:"))
+        columns = [field.strip() for field in format[7:].split(",")]
+        keepchs = self.chskeeper(format)
+        payload = {}  # (类型, 样式, 文本): 行号
+        events = {}  # 需要繁化的字幕行的位置: (行号, 文本)
+        for index, line in enumerate(lines):
+            kind, sep, value = line.partition(":")
+            if not sep or kind not in ("Dialogue", "Comment"):
+                continue
+            if keepchs(line, line):
+                continue
+            values = value.removeprefix(" ").split(",", len(columns) - 1)
+            if len(values) != len(columns):
+                continue
+            style, text = values[columns.index("Style")], values[-1]
+            lineid = payload.setdefault((kind, style, text), len(payload))
+            events[index] = (lineid, text)
+
+        asscontent = ["[Script Info]\nScriptType: v4.00+\n\n"]
+        span = indexsections(content).get("v4+ styles")
+        if span is not None:
+            asscontent.append(content[span[0] : span[2]])  # 繁化姬按样式处理部分设置
+        asscontent.append(
+            "[Events]\nFormat: Layer, Start, End, Style, Name, "
+            "MarginL, MarginR, MarginV, Effect, Text\n"
+        )
+        for (kind, style, text), lineid in payload.items():
+            asscontent.append(
+                f"{kind}: 0,0:00:00.00,0:00:00.00,{style},{lineid},0,0,0,,{text}\n"
+            )
+        self.master.log(f"繁化 {len(events)} 行字幕（去重后 {len(payload)} 行）")
+        result = self.requestzhconvert("".join(asscontent))
+
+        converted = {}
+        span = indexsections(result).get("events")
+        if span is not None:
+            for line in result[span[1] : span[2]].split("\n"):
+                kind, sep, value = line.partition(":")
+                if not sep or kind not in ("Dialogue", "Comment"):
+                    continue
+                values = value.removeprefix(" ").split(",", 9)
+                if len(values) == 10 and values[4].isdigit():
+                    converted[int(values[4])] = values[9]
+        missing = 0
+        for index, (lineid, text) in events.items():
+            if lineid not in converted:
+                missing += 1
+                continue
+            line = lines[index]
+            lines[index] = line[: len(line) - len(text)] + converted[lineid]
+        if missing > 0:
+            self.master.log(f"※繁化结果中缺少 {missing} 行，这些行保留简中")
+
+        self.assoriginal_cht = content[:body] + "\n".join(lines) + content[end:]
+        zhconvertcomment = re.search(
+            r"^Comment\: Processed by 繁化姬.*$", result, flags=re.MULTILINE
+        )  # 繁化姬注释，由 clean_scriptinfo 整理
+        span = indexsections(self.assoriginal_cht).get("script info")
+        if zhconvertcomment and span is not None:
+            self.assoriginal_cht = (
+                self.assoriginal_cht[: span[1]]
+                + f"{zhconvertcomment.group(0)}\n"
+                + self.assoriginal_cht[span[1] :]
+            )
+        self.assoriginal_cht = self.clean_scriptinfo(self.assoriginal_cht, "CHT_JPN")
+        self.asschts.append(self.assoriginal_cht)
+
+    # 请求繁化姬繁化字幕内容，请求内容不变时使用缓存
+    def requestzhconvert(self, asscontent: str) -> str:
         headers = {
             "accept": "application/json, text/plain, */*",
             "accept-language": "zh-CN",
@@ -658,61 +1181,31 @@ class ASSGenerate:
             "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
         }
         json_data = self.master.getconfig("zhconvert_json")
-        asscontent = self.assoriginal
         json_data = json.loads(json_data)
         for _key, _value in json_data.items():
             if isinstance(_value, str) and "{ASSCONTENT}" in _value:
                 json_data[_key] = json_data[_key].replace("{ASSCONTENT}", asscontent)
-        response = requests.post(
-            "https://api.zhconvert.org/convert", headers=headers, json=json_data
-        )
-        data = response.text
-        self.assoriginal_cht = json.loads(data)["data"]["text"]
-        self.assoriginal_cht = self.clean_scriptinfo(self.assoriginal_cht, "CHT_JPN")
-
-        generate_cht_styles: str = self.master.getconfig("generate_cht_styles")
-        generate_cht_styles = generate_cht_styles.split(",")
-        generate_cht_keep_comment = self.master.getconfig("generate_cht_keep_comment")
-        chs_lines = (
-            re.search(r"\[Events\]\n([\s\S\n]+)", self.assoriginal).group(1).split("\n")
-        )
-        cht_lines = (
-            re.search(r"\[Events\]\n([\s\S\n]+)", self.assoriginal_cht)
-            .group(1)
-            .split("\n")
-        )
-        chs_lines = [x for x in chs_lines if x.strip()]
-        cht_lines = [x for x in cht_lines if x.strip()]
-        format = re.search(
-            r"^(Format:.+)$",
-            "\n".join(chs_lines),
-            re.MULTILINE,
-        ).group(1)
-        for index, _ in enumerate(chs_lines):
-            chs_line = chs_lines[index]
-            cht_line = cht_lines[index]
-            if len(generate_cht_styles) > 0:
-                _stylename = self.master.get_assformat_by_key(format, chs_line, "Name")
-                if _stylename in generate_cht_styles:
-                    cht_lines[index] = chs_lines[index]
-            if generate_cht_keep_comment:
-                if (
-                    cht_line.startswith("Comment:")
-                    and self.master.get_assformat_by_key(
-                        format, chs_line, "Effect"
-                    ).lower()
-                    != "karaoke"
-                ):
-                    cht_lines[index] = chs_lines[index]
-        cht_lines = "\n".join(cht_lines)
-        cht_lines = f"{cht_lines}\n".replace("\\", "\\\\")
-        self.assoriginal_cht = re.sub(
-            r"\[Events\]\n[\s\S\n]+",
-            f"[Events]\n{cht_lines}",
-            self.assoriginal_cht,
-        )
-
-        self.asschts.append(self.assoriginal_cht)
+        cachekey = self.master.zhconvertcachekey(json_data)
+        text = self.master.getzhconvertcache(cachekey)
+        if text is not None:
+            self.master.log("使用繁化缓存")
+            return text
+        try:
+            response = self.master.httppost(
+                "https://api.zhconvert.org/convert",
+                headers=headers,
+                json=json_data,
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise RuntimeError(f"繁化姬请求失败：{e}") from e
+        if data.get("code") != 0 or not isinstance(data.get("data"), dict):
+            raise RuntimeError(f"繁化姬返回错误：{data.get('code')} {data.get('msg')}")
+        text = data["data"]["text"]
+        self.master.savezhconvertcache(cachekey, text)
+        self.master.trimzhconvertcache()
+        return text
 
     # 日文字幕生成
     def jpconvert(self):
@@ -786,9 +1279,9 @@ class ASSGenerate:
             # self.master.log("未指定mkv文件，跳过卡拉OK模板化")
             # return
             _nomkv = True
-        if os.path.exists(self.master.folder / "ass"):
-            shutil.rmtree(self.master.folder / "ass")
-        os.makedirs(self.master.folder / "ass")
+        if os.path.exists(self.master.workdir / "ass"):
+            shutil.rmtree(self.master.workdir / "ass")
+        os.makedirs(self.master.workdir / "ass")
 
         generate_language: str = self.master.getconfig("generate_language")
         generate_language = generate_language.split(",")
@@ -801,7 +1294,7 @@ class ASSGenerate:
                 )
                 for _ in range(8)
             )
-            mkv_tmp = self.master.folder / "ass" / f"{mkv_tmp}.mkv"
+            mkv_tmp = self.master.workdir / "ass" / f"{mkv_tmp}.mkv"
             shutil.copy(self.master.mkv[0], mkv_tmp)
         for index, asss in enumerate([self.asschss, self.asschts, self.assjpns]):
             for ass in asss:
@@ -825,7 +1318,7 @@ class ASSGenerate:
                 karaoke_out = f"{karaoke_tmp}.out.ass"
                 karaoke_tmp = f"{karaoke_tmp}.ass"
                 with open(
-                    self.master.folder / "ass" / f".{karaoke_tmp}",
+                    self.master.workdir / "ass" / f".{karaoke_tmp}",
                     "w",
                     encoding="utf-8-sig",
                 ) as file:
@@ -845,64 +1338,58 @@ class ASSGenerate:
                     "kara-templater.lua",
                     "--loglevel",
                     aegisub_cli_loglevel,
-                    str(self.master.folder / "ass" / f".{karaoke_tmp}"),
-                    str(self.master.folder / "ass" / f".{karaoke_out}"),
+                    str(self.master.workdir / "ass" / f".{karaoke_tmp}"),
+                    str(self.master.workdir / "ass" / f".{karaoke_out}"),
                     "Apply karaoke template",
                 ]
                 process = subprocess.Popen(
                     command,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    shell=True,
+                    shell=os.name == "nt",
                     universal_newlines=True,
                 )
                 for line in process.stdout:
                     self.master.log(line.rstrip())
                     print(line, end="")
                 process.wait()
-                self.clean_karaoke(
-                    self.master.folder / "ass" / f".{karaoke_out}",
-                    self.master.folder / "ass" / filename,
+                content = self.clean_karaoke(
+                    self.master.workdir / "ass" / f".{karaoke_out}",
                     scriptinfo_language[index],
                 )
-                os.remove(self.master.folder / "ass" / f".{karaoke_tmp}")
-                os.remove(self.master.folder / "ass" / f".{karaoke_out}")
-                self.results.append(self.master.folder / "ass" / filename)
+                os.remove(self.master.workdir / "ass" / f".{karaoke_tmp}")
+                os.remove(self.master.workdir / "ass" / f".{karaoke_out}")
+                self.results.append(
+                    ASSDocument.fromstring(
+                        self.master.workdir / "ass" / filename, content
+                    )
+                )
         if not _nomkv:
             os.remove(mkv_tmp)
 
-    def clean_karaoke(
-        self, file_path: str, output_path: str, script_info_language: str
-    ):
+    def clean_karaoke(self, file_path: str, script_info_language: str) -> str:
         content = ""
         with open(file_path, "r", encoding="utf-8-sig") as file:
             content = file.read()
         content = self.clean_scriptinfo(content, script_info_language)
         content = self.clean_garbage(content)
         content = self.clean_furigana(content)
-        with open(output_path, "w", encoding="utf-8-sig") as file:
-            file.write(content)
+        return content
 
-    # 保存文件
+    # 保存生成结果（只保存在内存中，字体处理后才写入 result）
     def savefiles(self):
         if len(self.assengoriginal) > 0:
             filename = self.asseng_filename
-            with open(
-                self.master.folder / "ass" / filename,
-                "w",
-                encoding="utf-8-sig",
-            ) as file:
-                file.write(self.assengoriginal)
-            self.results.append(self.master.folder / "ass" / filename)
+            self.results.append(
+                ASSDocument.fromstring(
+                    self.master.workdir / "ass" / filename, self.assengoriginal
+                )
+            )
 
         _generate_karaoke = self.master.getconfig("generate_karaoke")
         if _generate_karaoke:
             return
 
-        if os.path.exists(self.master.folder / "ass"):
-            shutil.rmtree(self.master.folder / "ass")
-        os.makedirs(self.master.folder / "ass")
-
         generate_language: str = self.master.getconfig("generate_language")
         generate_language = generate_language.split(",")
         for index, asss in enumerate([self.asschss, self.asschts, self.assjpns]):
@@ -917,205 +1404,1827 @@ class ASSGenerate:
                     "." + self.getstyle(ass) + ".",
                     filename,
                 )
-                with open(
-                    self.master.folder / "ass" / filename,
-                    "w",
-                    encoding="utf-8-sig",
-                ) as file:
-                    file.write(ass)
-                self.results.append(self.master.folder / "ass" / filename)
+                self.results.append(
+                    ASSDocument.fromstring(self.master.workdir / "ass" / filename, ass)
+                )
+
+
+# 字幕样式
+class ASSStyle(NamedTuple):
+    name: str
+    fontname: str
+
+
+# 字幕行
+class ASSDialogue(NamedTuple):
+    style: str
+    text: str
+
+
+# 没有 Format 行时使用的默认列
+ASS_STYLE_FORMAT = ["Name", "Fontname"]
+ASS_EVENT_FORMAT = [
+    "Layer",
+    "Start",
+    "End",
+    "Style",
+    "Name",
+    "MarginL",
+    "MarginR",
+    "MarginV",
+    "Effect",
+    "Text",
+]
+
+
+# 逐行解析字幕，依次返回样式及字幕行
+# 每个部分的 Format 行只解析一次，可以直接传入文件对象，不需要载入整个文件
+def iterass(lines: Iterable[str]) -> Iterator[ASSStyle | ASSDialogue]:
+    section = ""
+    columns = {}
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.startswith("["):
+            section = line.strip().lower()
+            columns = {}
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        if key == "Format":
+            fields = [field.strip() for field in value.split(",")]
+            columns = {field: index for index, field in enumerate(fields)}
+        elif key == "Style" and section in ("[v4+ styles]", "[v4 styles]"):
+            if len(columns) == 0:
+                columns = {field: index for index, field in enumerate(ASS_STYLE_FORMAT)}
+            values = value.removeprefix(" ").split(",")
+            if len(values) > max(columns["Name"], columns["Fontname"]):
+                yield ASSStyle(values[columns["Name"]], values[columns["Fontname"]])
+        elif key == "Dialogue" and section == "[events]":
+            if len(columns) == 0:
+                columns = {field: index for index, field in enumerate(ASS_EVENT_FORMAT)}
+            values = value.removeprefix(" ").split(",", len(columns) - 1)
+            if len(values) == len(columns):
+                yield ASSDialogue(values[columns["Style"]], values[columns["Text"]])
+
+
+# 特效标签中的 \fn 字体名称（到下一个标签或 } 为止）
+ASS_FONT_TAG = re.compile(r"\\fn([^\\}]*)")
+
+
+# 逐行替换字幕中使用的字体名称，依次返回替换后的行（保留原来的换行符）
+# 只替换样式的 Fontname 列及 \fn 标签中完整的字体名称（保留竖排的 @），其余内容原样返回
+def rewriteass(lines: Iterable[str], replacedict: dict[str, str]) -> Iterator[str]:
+    def replacefont(fontname: str) -> str:
+        name = fontname.lstrip("@")
+        if name not in replacedict:
+            return fontname
+        return f"{fontname[: len(fontname) - len(name)]}{replacedict[name]}"
+
+    def replacetag(match: re.Match) -> str:
+        name = match.group(1)
+        closing = ""
+        if name.endswith(")") and name.count(")") > name.count("("):
+            name, closing = name[:-1], ")"  # \t(...\fn字体) 的右括号
+        return f"\\fn{replacefont(name)}{closing}"
+
+    section = ""
+    columns = {}
+    for line in lines:
+        if line.startswith("["):
+            section = line.strip().lower()
+            columns = {}
+            yield line
+            continue
+        key, sep, value = line.partition(":")
+        if key == "Format" and sep:
+            fields = [field.strip() for field in value.split(",")]
+            columns = {field: index for index, field in enumerate(fields)}
+        elif key == "Style" and sep and section in ("[v4+ styles]", "[v4 styles]"):
+            if len(columns) == 0:
+                columns = {field: index for index, field in enumerate(ASS_STYLE_FORMAT)}
+            content = value.rstrip("\r\n")
+            prefix = " " if content.startswith(" ") else ""
+            values = content.removeprefix(" ").split(",")
+            if len(values) > columns["Fontname"]:
+                values[columns["Fontname"]] = replacefont(values[columns["Fontname"]])
+                line = f"Style:{prefix}{','.join(values)}{value[len(content):]}"
+        elif section == "[events]" and "\\fn" in line:
+            line = ASS_FONT_TAG.sub(replacetag, line)
+        yield line
+
+
+# 字幕文本中的转义字符：\N 换行不需要字符，\n 在默认换行模式下显示为空格，\h 为不换行空格
+ASS_ESCAPES = {"N": "", "n": " ", "h": "\u00a0"}
+
+
+# 解析一个特效标签块，返回新的 (字体, 重置用字体, 是否为绘图模式)
+# \t(...) 中的 \fn 同样生效，\r 重置为本行样式，\r样式 重置为指定样式（不存在时为本行样式）
+def parseoverride(
+    block: str,
+    font: str,
+    base_font: str,
+    drawing: bool,
+    style_font: str,
+    styles: dict[str, str],
+) -> tuple[str, str, bool]:
+    for tag in block.split("\\")[1:]:
+        if tag.startswith("fn"):
+            name = tag[2:]
+            if name.endswith(")") and name.count(")") > name.count("("):
+                name = name[:-1]  # \t(...\fn字体) 的右括号
+            font = name if len(name) > 0 else base_font
+        elif tag.startswith("r"):
+            name = tag[1:].rstrip(")")
+            base_font = styles.get(name, style_font) if len(name) > 0 else style_font
+            font = base_font
+            drawing = False
+        elif tag.startswith("p") and tag[1:].rstrip(")").strip().isdigit():
+            drawing = int(tag[1:].rstrip(")")) > 0
+    return font, base_font, drawing
+
+
+# 逐个片段扫描一行字幕文本，返回 (字体, 显示的文本) 片段
+# 只有能匹配到 } 的 { 才是特效标签，绘图模式下的内容不需要字体
+def iterfontruns(
+    text: str, style_font: str, styles: dict[str, str]
+) -> Iterator[tuple[str, str]]:
+    font = base_font = style_font
+    drawing = False
+    run = []
+    pos = 0
+    brace = text.find("{")
+    escape = text.find("\\")
+    closing = 0  # 之后没有 } 时为 -1
+    while pos < len(text):
+        if 0 <= brace < pos:
+            brace = text.find("{", pos)
+        if 0 <= escape < pos:
+            escape = text.find("\\", pos)
+        nextpos = min(
+            (x for x in (brace, escape) if x >= 0),
+            default=len(text),
+        )
+        if nextpos > pos:
+            if not drawing:
+                run.append(text[pos:nextpos])
+            pos = nextpos
+            continue
+        if pos == brace:
+            if closing >= 0:
+                closing = text.find("}", pos + 1)
+            if closing >= 0:
+                if run:
+                    yield font, "".join(run)
+                    run = []
+                font, base_font, drawing = parseoverride(
+                    text[pos + 1 : closing],
+                    font,
+                    base_font,
+                    drawing,
+                    style_font,
+                    styles,
+                )
+                pos = closing + 1
+                continue
+        elif text[pos + 1 : pos + 2] in ASS_ESCAPES:
+            if not drawing:
+                run.append(ASS_ESCAPES[text[pos + 1]])
+            pos += 2
+            continue
+        if not drawing:
+            run.append(text[pos])
+        pos += 1
+    if run:
+        yield font, "".join(run)
 
 
 class ASSFont:
-    def __init__(self, master):
+    def __init__(self):
         self.styles = {}
-        self.dialogues = []
-        self.fonts = {}
-        self.filecontent = ""
-        self.get_assformat_by_key = master.get_assformat_by_key
+        self.dialogues: list[ASSDialogue] = []  # 读取时样式还未出现的字幕行
+        self.fonts: dict[str, set[str]] = {}  # 每个字体用到的字符集合
 
-    # 读取字幕文件
+    # 读取字幕文件（逐行读取）
     def readfile(self, assfile: Path):
         with open(assfile, "r", encoding="utf-8-sig") as file:
-            self.filecontent = file.read()
-
-    # 读取字幕样式
-    def readstyles(self):
-        styles = re.findall(r"^(Style:.+)$", self.filecontent, re.MULTILINE)
-        for style in styles:
-            match = re.search(r"^Style: ?([^,]*),([^,]*)", style)
-            self.styles[match.group(1)] = match.group(2)
-
-    # 读取字幕行
-    def readdialogues(self):
-        format = re.search(
-            r"^(Format:.+)$",
-            re.search(r"\[Events\]\n([\s\S\n]+)", self.filecontent).group(1),
-            re.MULTILINE,
-        ).group(1)
-        dialogues = re.findall(r"^(Dialogue:.+)$", self.filecontent, re.MULTILINE)
-        for dialogue in dialogues:
-            self.dialogues.append(
-                {
-                    "style": self.get_assformat_by_key(format, dialogue, "Style"),
-                    "content": self.get_assformat_by_key(format, dialogue, "Text"),
-                }
-            )
+            self.read(file)
+
+    # 解析字幕，读取样式并收集每行字幕的字体
+    def read(self, lines: Iterable[str]):
+        for record in iterass(lines):
+            if isinstance(record, ASSStyle):
+                self.styles[record.name] = record.fontname
+            elif record.style in self.styles:
+                self.collectdialogue(record)
+            else:
+                self.dialogues.append(record)
 
-    # 混合多字幕的字体信息
-    def mergefonts(self, fonts: dict):
-        for font, content in fonts.items():
+    # 混合多字幕的字体信息（合并字符集合）
+    def mergefonts(self, fonts: dict[str, set[str]]):
+        for font, chars in fonts.items():
             if font not in self.fonts:
-                self.fonts[font] = ""
-            self.fonts[font] += content
+                self.fonts[font] = set()
+            self.fonts[font] |= chars
 
-    # 删除重复字符
+    # 补充必需字符，并将字符集合整理为排序后的字符串
     def remove_duplicates(self):
-        for font, content in self.fonts.items():
-            content = f"{content}ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"  # 必需加上大小写英语和数字才能正常显示字体
-            if re.search(r"０１２３４５６７８９", content):
-                content = f"{content}０１２３４５６７８９"
-            unique_chars = set(content)
-            self.fonts[font] = "".join(sorted(unique_chars))
+        for font, chars in self.fonts.items():
+            chars = chars | set(
+                "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+            )  # 必需加上大小写英语和数字才能正常显示字体
+            if not chars.isdisjoint("０１２３４５６７８９"):
+                chars |= set("０１２３４５６７８９")
+            self.fonts[font] = "".join(sorted(chars))
 
     # 添加字体信息
     def addfont(self, fontname: str, content: str):
-        content = re.sub(r"\{[^\{]*\}", "", content)  # 去掉特效标签部分
-        if len(content) == 0:  # 如果此时已经为空则不添加此信息（避免添加未用到的字体）
+        if len(content) == 0:  # 如果为空则不添加此信息（避免添加未用到的字体）
             return
         if fontname.startswith("@"):  # 如果使用倒置则去掉倒置符号
             fontname = fontname.lstrip("@")
         if fontname not in self.fonts:
-            self.fonts[fontname] = ""
-        self.fonts[fontname] += content
+            self.fonts[fontname] = set()
+        self.fonts[fontname].update(content)
 
-    # 清除\p1绘图
-    def cleandraw(self, content: str) -> str:
-        content = re.sub(r"\\p1[^{}]*}.*?{[^{}]*\\p0", "", content)
-        content = re.sub(r"\\p1[^{}]*}.*?$", "}", content)
-        return content
+    # 收集一行字幕的字体
+    def collectdialogue(self, dialogue: ASSDialogue):
+        for fontname, content in iterfontruns(
+            dialogue.text, self.styles[dialogue.style], self.styles
+        ):
+            self.addfont(fontname, content)
 
-    # 对\fn进行分片分析
-    def collectfontbypart(self, default_font: str, content: str):
-        content = f"{{\\fn{default_font}}}{content}"
-        match = re.findall(r"\\fn.*?(?=\\fn|$)", content)
-        for part in match:
-            font = re.search(r"\\fn([^\\\}]*)", part).group(1)
-            if len(font) == 0:
-                font = default_font
-            part = re.sub(r"^[^\{\}]*\}", "", part)
-            part = re.sub(r"\{[^\{\}]*$", "", part)
-            self.addfont(font, part)
-
-    # 收集字体
+    # 收集读取时样式还未出现的字幕行的字体
     def collectfont(self):
         for dialogue in self.dialogues:
-            default_style = dialogue["style"]
-            content = dialogue["content"]
-            if r"\p1" in content:
-                content = self.cleandraw(content)
-            if r"\fn" in content:
-                self.collectfontbypart(self.styles[default_style], content)
-                continue
-            self.addfont(self.styles[default_style], content)
+            self.collectdialogue(dialogue)
+        self.dialogues = []
 
 
-class ASSFunUI(Tk):
-    def __init__(self):
-        super().__init__()
+# 收集单个字幕内容的字体及字符（可在子进程中运行）
+def collectassfile(lines: list[str]) -> dict[str, set[str]]:
+    assfont = ASSFont()
+    assfont.read(lines)
+    assfont.collectfont()
+    return assfont.fonts
+
+
+# json 格式的字体缓存，字体信息和索引分别保存，查找时载入整个索引
+class FontCacheJSON:
+    def __init__(self, cache_file: Path, fontindex_file: Path):
+        self.cache_file = cache_file
+        self.fontindex_file = fontindex_file
+        self.cache = None
+        self.fontindex = None
+
+    # 读取缓存文件，版本不符时视为不存在
+    def read(self) -> dict:
+        if self.cache is None:
+            self.cache = {}
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, "r", encoding="utf-8-sig") as json_file:
+                    cache = json.load(json_file)
+                if cache.get("version") == CACHE_VERSION:
+                    self.cache = cache
+        return self.cache
+
+    def exists(self) -> bool:
+        return len(self.read()) > 0
+
+    # 缓存生成时字体文件夹的签名
+    def signature(self) -> str:
+        return self.read().get("signature", "")
+
+    # 读取全部字体信息
+    def load(self) -> dict:
+        return self.read().get("fonts", {})
+
+    def loadindex(self) -> dict:
+        fontindex = {}
+        if os.path.exists(self.fontindex_file):
+            with open(self.fontindex_file, "r", encoding="utf-8-sig") as json_file:
+                fontindex = json.load(json_file)
+            if fontindex.get("version") != CACHE_VERSION:
+                fontindex = {}
+            else:
+                fontindex = fontindex["index"]
+        if len(fontindex) == 0:  # 索引丢失时由缓存重新生成
+            fontindex = buildfontindex(self.load())
+        return fontindex
+
+    # 查找字体名称对应的字体（已按优先顺序排列）
+    def lookup(self, key: str) -> list | None:
+        if self.fontindex is None:
+            self.fontindex = self.loadindex()
+        return self.fontindex.get(key)
+
+    def save(self, cache: dict, fontindex: dict, signature: str = ""):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        self.cache = {"version": CACHE_VERSION, "signature": signature, "fonts": cache}
+        for path, data in (
+            (self.cache_file, self.cache),
+            (self.fontindex_file, {"version": CACHE_VERSION, "index": fontindex}),
+        ):
+            if os.path.exists(path):
+                os.remove(path)
+            with open(path, "w", encoding="utf-8-sig") as json_file:
+                json.dump(data, json_file, ensure_ascii=False)
+        self.fontindex = fontindex
+
+    def remove(self):
+        for path in (self.cache_file, self.fontindex_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# sqlite 格式的字体缓存，启动时不需要载入，查找字体时直接查询索引表
+class FontCacheDB:
+    def __init__(self, cache_file: Path):
+        self.cache_file = cache_file
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.cache_file)
+
+    def exists(self) -> bool:
+        if not os.path.exists(self.cache_file):
+            return False
+        with closing(self.connect()) as db:
+            (version,) = db.execute("PRAGMA user_version").fetchone()
+        return version == CACHE_VERSION
+
+    def signature(self) -> str:
+        if not self.exists():
+            return ""
+        with closing(self.connect()) as db:
+            row = db.execute(
+                "SELECT value FROM meta WHERE key = 'signature'"
+            ).fetchone()
+        return row[0] if row else ""
+
+    def load(self) -> dict:
+        if not self.exists():
+            return {}
+        with closing(self.connect()) as db:
+            rows = db.execute("SELECT path, size, mtime, faces FROM fonts").fetchall()
+        return {
+            path: {"size": size, "mtime": mtime, "faces": json.loads(faces)}
+            for path, size, mtime, faces in rows
+        }
 
-        ctk.set_appearance_mode("dark")
-        self.geometry("600x500")
-        self.minsize(600, 500)
-        self.title("ASSFont - KyokuSai")
-        self.iconbitmap(resource_path("favicon.ico"))
+    def lookup(self, key: str) -> list | None:
+        if not self.exists():
+            return None
+        with closing(self.connect()) as db:
+            rows = db.execute(
+                "SELECT path, face, weight, italic FROM fontindex "
+                "WHERE name = ? ORDER BY rank",
+                (key,),
+            ).fetchall()
+        return [
+            [path, face, weight, bool(italic)] for path, face, weight, italic in rows
+        ] or None
+
+    def save(self, cache: dict, fontindex: dict, signature: str = ""):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        self.remove()
+        with closing(self.connect()) as db, db:
+            db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute(
+                "CREATE TABLE fonts (path TEXT PRIMARY KEY, size INTEGER, "
+                "mtime REAL, faces TEXT)"
+            )
+            db.execute(
+                "CREATE TABLE fontindex (name TEXT, rank INTEGER, path TEXT, "
+                "face INTEGER, weight INTEGER, italic INTEGER, "
+                "PRIMARY KEY (name, rank)) WITHOUT ROWID"
+            )
+            db.execute("INSERT INTO meta VALUES ('signature', ?)", (signature,))
+            db.executemany(
+                "INSERT INTO fonts VALUES (?, ?, ?, ?)",
+                (
+                    (
+                        path,
+                        entry["size"],
+                        entry["mtime"],
+                        json.dumps(entry["faces"], ensure_ascii=False),
+                    )
+                    for path, entry in cache.items()
+                ),
+            )
+            db.executemany(
+                "INSERT INTO fontindex VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (name, rank, *entry)
+                    for name, entries in fontindex.items()
+                    for rank, entry in enumerate(entries)
+                ),
+            )
+            db.execute(f"PRAGMA user_version = {CACHE_VERSION}")
 
-        self.grid_columnconfigure([0, 1, 2], weight=1)
+    def remove(self):
+        if os.path.exists(self.cache_file):
+            os.remove(self.cache_file)
 
+
+# 批量处理中的一集
+class ASSEpisode(NamedTuple):
+    name: str
+    mkv: Path | None
+    files: list[Path]
+    eng: Path | None
+
+
+# 查找批量处理的剧集，返回剧集及未能配对的文件
+# source 为文件夹时按文件名配对：字幕文件名以 mkv 文件名（不含扩展名）开头，名称中带有 eng_symbol 的为英语字幕
+# source 为 json 清单时，每项为 {"name": 可选, "mkv": 可选, "ass": 字幕或字幕列表, "eng": 可选}，相对路径以清单所在文件夹为准
+def findepisodes(source: Path, eng_symbol: str) -> tuple[list[ASSEpisode], list[Path]]:
+    if os.path.isfile(source):
+        root = Path(os.path.dirname(os.path.abspath(source)))
+        with open(source, "r", encoding="utf-8-sig") as json_file:
+            manifest = json.load(json_file)
+        episodes = []
+        for item in manifest:
+            ass = item["ass"] if isinstance(item["ass"], list) else [item["ass"]]
+            files = [root / file for file in ass]
+            mkv = root / item["mkv"] if item.get("mkv") else None
+            eng = root / item["eng"] if item.get("eng") else None
+            name = item.get("name") or (mkv or files[0]).stem
+            episodes.append(ASSEpisode(name, mkv, files, eng))
+        return episodes, []
+
+    mkvs = sorted(Path(source).glob("*.mkv"))
+    files = {mkv: [] for mkv in mkvs}
+    engs = {}
+    unpaired = []
+    for ass in sorted(Path(source).glob("*.ass")):
+        matches = [mkv for mkv in mkvs if ass.name.startswith(mkv.stem)]
+        if len(matches) == 0:
+            unpaired.append(ass)
+            continue
+        mkv = max(matches, key=lambda m: len(m.stem))  # 文件名最接近的 mkv
+        if len(eng_symbol) > 0 and eng_symbol in ass.name:
+            engs[mkv] = ass
+        else:
+            files[mkv].append(ass)
+    episodes = []
+    for mkv in mkvs:
+        if len(files[mkv]) == 0:
+            unpaired.append(mkv)
+            continue
+        episodes.append(ASSEpisode(mkv.stem, mkv, files[mkv], engs.get(mkv)))
+    return episodes, unpaired
+
+
+# 字幕处理流程，不依赖图形界面（命令行模式直接使用此类）
+class ASSFun:
+    def __init__(self):
         if getattr(sys, "frozen", False):
             self.folder = os.path.abspath(os.path.dirname(sys.executable))
         else:
             self.folder = os.path.abspath(os.path.dirname(__file__))
         self.folder: Path = Path(self.folder)
+        self.workdir: Path = self.folder  # 生成的字幕(ass)及处理结果(result)的保存位置
         self.cache = {}
+        self.cache_dir = self.folder / "data" / "fontcache"
         self.cache_file = self.folder / "data" / "cache.json"
+        self.cachedb_file = self.folder / "data" / "cache.db"
+        self.fontindex_file = self.folder / "data" / "fontindex.json"
+        self.fontroots: list[str] = []
+        self.cachestores: dict[str, FontCacheJSON | FontCacheDB] = {}
+        self.fontindex = {}
+        self.signatures = {}
+        self.subsetcache_dir = self.folder / "data" / "subsetcache"
+        self.asscache_file = self.folder / "data" / "asscache.json"
+        self.zhconvertcache_dir = self.folder / "data" / "zhconvert"
         self.config = {}
         self.config_file = self.folder / "data" / "config.json"
+        self.overrides = {}  # 不保存的临时设置
         self.assstyles = {}
-        ctk.FontManager.load_font(resource_path("NotoSansSC-Medium.otf"))
-        self.font = ctk.CTkFont(family="NotoSansSC-Medium", size=18, weight="normal")
+        self.assstyles_name = ""  # 命令行中指定的样式表
         self.mkv: list[Path] = []
         self.files: list[Path] = []
+        self.documents: list[ASSDocument] = []  # files 对应的字幕内容
         self.asss: list[Path] = []
         self.eng: list[Path] = []
-        self.values = {}
-        self.configwindow = None
+        self.values = {"assgenerate": False, "subset": True, "usecache": True}
+        self.timings: dict[str, float] = {}  # 各阶段用时(秒)
+        self.logprefix = ""
+        self.cachelock = threading.RLock()  # 批量处理时各剧集共用的缓存文件
+        self.executor: concurrent.futures.Executor | None = None
+        self.session: requests.Session | None = None  # 繁化姬请求共用的连接
+        self.httpsemaphore: threading.BoundedSemaphore | None = None
+
+    # 读取设置及字体缓存，设置代理
+    def setup(self):
+        self.setconfig()
+        self.getcache(init=True)
 
-        self.style_CTkTextbox = dict(
-            text_color="#FFFFFF",
-            fg_color="#666666",
-            border_color="#FFFFFF",
-            scrollbar_button_color="#DDDDDD",
-            scrollbar_button_hover_color="#EEEEEE",
-            font=self.font,
-            wrap="none",
-            corner_radius=4,
-            border_width=2,
-            border_spacing=0,
+        proxy_port = self.getconfig("proxy")
+        if proxy_port != "0":
+            proxy_address = f"http://127.0.0.1:{proxy_port}"
+            os.environ["HTTP_PROXY"] = proxy_address
+            os.environ["HTTPS_PROXY"] = proxy_address
+            self.log(f"使用代理：{proxy_address}")
+        self.createsession()
+
+    # 创建网络请求共用的会话（批量处理时各剧集共用）
+    # 保持连接，遇到 429 及 5xx 时按指数退避重试，同时进行的请求数不超过 http_concurrency
+    def createsession(self):
+        if self.session is not None:
+            self.session.close()
+        concurrency = max(int(self.getconfig("http_concurrency")), 1)
+        retry = Retry(
+            total=int(self.getconfig("http_retries")),
+            backoff_factor=float(self.getconfig("http_backoff")),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,  # 繁化姬使用 POST，也需要重试
         )
-        self.after(10, self._create_widgets)
-        self.after(250, self._init)
+        adapter = HTTPAdapter(pool_maxsize=concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.httpsemaphore = threading.BoundedSemaphore(concurrency)
+
+    # 发送 POST 请求，使用设置中的连接及读取超时时间
+    def httppost(self, url: str, **kwargs) -> requests.Response:
+        if self.session is None:
+            self.createsession()
+        timeout = (
+            float(self.getconfig("http_connect_timeout")),
+            float(self.getconfig("http_read_timeout")),
+        )
+        with self.httpsemaphore:
+            return self.session.post(url, timeout=timeout, **kwargs)
 
-    def _create_widgets(self):
-        row = 0
+    def get_assformat_by_key(self, format: str, content: str, key: str) -> str:
+        format = format.replace(" ", "").split(",")
+        index = format.index(key)
+        content = content.split(",")
+        value = content[index]
+        if key == "Text":
+            value = ",".join(content[index:])
+        value = re.sub(r"^ ", "", value)
+        return value
 
-        self.mkvbox = ctk.CTkTextbox(self, height=25, **self.style_CTkTextbox)
-        self.mkvbox.grid(
-            row=row, column=0, padx=16, pady=(10, 5), sticky="ew", columnspan=3
-        )
-        self.mkvbox.drop_target_register(DND_ALL)
-        self.mkvbox.dnd_bind(
-            "<<Drop>>",
-            partial(
-                self.file_drop,
-                box=self.mkvbox,
-                format="mkv",
-                files="mkv",
-                multiple=False,
-            ),
-        )
-        self.mkvbox.insert(ctk.END, "拖入mkv文件(如果要混流)")
-        self.mkvbox.configure(state="disabled")
-        row = row + 1
+    def log(self, text: str):
+        print(f"{self.logprefix}{text}\n", end="")  # 一次写入，批量处理时各行不会交错
+
+    # 选择样式表，返回样式表文件（命令行中由 --styles 指定，只有一个样式表时直接使用）
+    def selectassstyles(self, assstyles: dict[str, str]) -> str | None:
+        name = self.assstyles_name
+        if os.path.isfile(name):
+            return name
+        for _name in (name, f"{name}.json"):
+            if _name in assstyles:
+                return assstyles[_name]
+        if len(name) == 0 and len(assstyles) == 1:
+            return next(iter(assstyles.values()))
+        if len(assstyles) > 1:
+            self.log(f"※请指定样式表：{', '.join(assstyles)}")
+        return None
 
-        self.filebox = ctk.CTkTextbox(self, height=175, **self.style_CTkTextbox)
-        self.filebox.grid(
-            row=row, column=0, padx=16, pady=(5, 5), sticky="ew", columnspan=3
-        )
-        self.filebox.drop_target_register(DND_ALL)
-        self.filebox.dnd_bind(
-            "<<Drop>>", partial(self.file_drop, box=self.filebox, files="files")
-        )
-        self.filebox.insert(ctk.END, "拖入字幕文件")
-        self.filebox.configure(state="disabled")
-        row = row + 1
+    # 选择默认字幕样式（使用 assmultistyle_defaulttrack 设置）
+    def selectdefaulttrack(self, selects: set[str], default: str) -> str:
+        return default
 
-        self.engbox = ctk.CTkTextbox(self, height=25, **self.style_CTkTextbox)
-        self.engbox.grid(
-            row=row, column=0, padx=16, pady=(10, 5), sticky="ew", columnspan=3
-        )
-        self.engbox.drop_target_register(DND_ALL)
-        self.engbox.dnd_bind(
-            "<<Drop>>",
-            partial(
-                self.file_drop,
-                box=self.engbox,
-                format="ass",
-                files="eng",
-                multiple=False,
-            ),
-        )
-        self.engbox.insert(ctk.END, "拖入单独英语字幕文件(如果有)")
+    # 字体缓存是否可用
+    def setusecache(self, value: bool):
+        self.values["usecache"] = value
+
+    # files 对应的字幕内容，生成的字幕直接使用内存中的结果，其余的字幕只读取一次
+    def getdocuments(self) -> list[ASSDocument]:
+        documents = {document.path: document for document in self.documents}
+        self.documents = [
+            documents.get(Path(file)) or ASSDocument.read(file) for file in self.files
+        ]
+        return self.documents
+
+    def getassfonts(self) -> dict:
+        assfont = ASSFont()
+        for fonts in self.collectassfiles(self.getdocuments()):
+            assfont.mergefonts(fonts)
+        assfont.remove_duplicates()
+        return assfont.fonts
+
+    # 收集每个字幕的字体及字符，按 documents 的顺序返回
+    # 内容相同的字幕只处理一次，处理过的内容直接使用缓存，其余的字幕较多时分给多个进程处理
+    def collectassfiles(
+        self, documents: list[ASSDocument]
+    ) -> list[dict[str, set[str]]]:
+        asscache = self.getasscache()
+        results = {}
+        pending = {}
+        entries = {}  # 新的收集结果及更新了使用时间的缓存
+        now = time.time()
+        keys = [document.digest() for document in documents]
+        for document, key in zip(documents, keys):
+            if key in results or key in pending:
+                continue
+            entry = asscache.get(key)
+            if entry is not None:
+                self.log(f"使用缓存：{document.path}")
+                results[key] = {
+                    font: set(chars) for font, chars in entry["fonts"].items()
+                }
+                entries[key] = {**entry, "time": now}
+            else:
+                pending[key] = document
+
+        asscollect_parallel = self.getconfig("asscollect_parallel")
+        workers = int(self.getconfig("asscollect_workers")) or os.cpu_count() or 1
+        workers = min(workers, len(pending))
+        if not asscollect_parallel or workers <= 1:
+            for key, document in pending.items():
+                self.log(f"处理文件：{document.path}")
+                results[key] = collectassfile(document.lines)
+        else:
+            self.log(f"使用 {workers} 个进程处理 {len(pending)} 个字幕文件")
+            with self.processpool(workers) as executor:
+                futures = {
+                    executor.submit(collectassfile, document.lines): (document, key)
+                    for key, document in pending.items()
+                }
+                for index, future in enumerate(
+                    concurrent.futures.as_completed(futures)
+                ):
+                    document, key = futures[future]
+                    results[key] = future.result()  # 处理出错时在这里抛出
+                    self.log(f"处理完成：{document.path} ({index + 1}/{len(pending)})")
+
+        for key in pending:
+            entries[key] = {
+                "time": now,
+                "fonts": {
+                    font: "".join(sorted(chars)) for font, chars in results[key].items()
+                },
+            }
+        if len(entries) > 0:
+            self.saveasscache(entries)
+        return [results[key] for key in keys]
+
+    # 读取字幕字体收集结果的缓存，未开启或版本不符时为空
+    def getasscache(self) -> dict:
+        if not self.getconfig("asscache"):
+            return {}
+        with self.cachelock:  # 批量处理时避免读到其他剧集正在保存的文件
+            if not os.path.exists(self.asscache_file):
+                return {}
+            with open(self.asscache_file, "r", encoding="utf-8-sig") as json_file:
+                asscache = json.load(json_file)
+        if asscache.get("version") != ASSCACHE_VERSION:
+            return {}
+        return asscache.get("files", {})
+
+    # 将新的收集结果合并到缓存文件（批量处理时各剧集会同时保存）
+    # 超过 asscache_size 条时删除最久未使用的结果
+    def saveasscache(self, entries: dict):
+        if not self.getconfig("asscache"):
+            return
+        maxsize = int(self.getconfig("asscache_size"))
+        with self.cachelock:
+            asscache = self.getasscache()
+            asscache.update(entries)
+            if len(asscache) > maxsize:
+                keys = sorted(
+                    asscache, key=lambda key: asscache[key].get("time", 0), reverse=True
+                )
+                asscache = {key: asscache[key] for key in keys[:maxsize]}
+            os.makedirs(os.path.dirname(self.asscache_file), exist_ok=True)
+            tmp_file = f"{self.asscache_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8-sig") as json_file:
+                json.dump(
+                    {"version": ASSCACHE_VERSION, "files": asscache},
+                    json_file,
+                    ensure_ascii=False,
+                )
+            os.replace(
+                tmp_file, self.asscache_file
+            )  # 写入完成后再替换，不会留下不完整的文件
+
+    # 根据字体名称获取字体文件及其中的 face 序号（按字体文件夹的优先级查找）
+    def getfontfile(self, fontname):
+        key = normalizefontname(fontname)
+        for font_root in self.fontroots:
+            entries = self.cachestores[font_root].lookup(key)
+            if entries:
+                font_path, face = entries[0][0], entries[0][1]
+                return font_path, os.path.basename(font_path), face
+        return None, None, None
+
+    # 字体文件夹，按查找优先级排列：
+    # 字幕同目录下的字体文件夹 > 设置中指定的文件夹 > 用户字体 > 系统字体
+    def getfontroots(self) -> list[str]:
+        font_roots = []
+        font_project_dirname: str = self.getconfig("font_project_dirname")
+        if len(font_project_dirname) > 0:
+            for file in self.files:
+                font_roots.append(
+                    os.path.join(os.path.dirname(file), font_project_dirname)
+                )
+        font_dirs: str = self.getconfig("font_dirs")
+        font_roots += [font_dir.strip() for font_dir in font_dirs.split(",")]
+        if self.getconfig("font_system_dirs"):
+            font_roots += getsystemfontdirs()
+        result = {}
+        for font_root in font_roots:
+            if len(font_root) == 0 or not os.path.isdir(font_root):
+                continue
+            font_root = os.path.abspath(font_root)
+            result.setdefault(os.path.normcase(font_root), font_root)
+        return list(result.values())
+
+    # 读取字体名称，字体较多时分给多个进程读取
+    def readfonts(self, font_paths: list[str]) -> dict[str, list[dict]]:
+        results = {}
+        fontcache_parallel = self.getconfig("fontcache_parallel")
+        workers = int(self.getconfig("fontcache_workers")) or os.cpu_count() or 1
+        workers = min(workers, len(font_paths))
+        if not fontcache_parallel or workers <= 1:
+            for font_path in font_paths:
+                try:
+                    results[font_path] = getfontfaces(font_path)
+                except Exception as e:
+                    self.log(f"字体读取错误：{e}")
+                    results[font_path] = []  # 同样记录下来，文件不变就不再重复读取
+            return results
+
+        timeout = float(self.getconfig("fontcache_timeout"))
+        self.log(f"使用 {workers} 个进程读取 {len(font_paths)} 个字体文件")
+        pool = multiprocessing.Pool(workers)
+        try:
+            tasks = [
+                (font_path, pool.apply_async(getfontfaces, (font_path,)))
+                for font_path in font_paths
+            ]
+            for font_path, task in tasks:
+                try:
+                    results[font_path] = task.get(timeout=timeout)
+                except multiprocessing.TimeoutError:
+                    # 超时的字体不记录，下次更新缓存时再尝试
+                    self.log(f"字体读取超时：{font_path}")
+                except Exception as e:
+                    self.log(f"字体读取错误：{e}")
+                    results[font_path] = []
+        finally:
+            pool.terminate()  # 结束可能卡在损坏字体上的进程
+        return results
+
+    # 生成字体信息缓存
+    # 只检查签名变化了的字体文件夹（force 时检查全部），并且只重新读取新增或修改过的字体
+    def generatecache(self, force: bool = False):
+        signatures = {}
+        font_paths = {}
+        for font_root in self.fontroots:
+            signature = getdirsignature(font_root)
+            store = self.cachestores[font_root]
+            if not force and store.exists() and store.signature() == signature:
+                continue
+            signatures[font_root] = signature
+            font_paths[font_root] = []
+            for root, _, files in os.walk(font_root):  # 有一些字体是在子文件夹中
+                for file in files:
+                    if file.lower().endswith((".ttf", ".otf", ".ttc")):
+                        font_paths[font_root].append(os.path.join(root, file))
+        if len(signatures) == 0:
+            self.log("字体文件夹均未变化")
+            return
+
+        caches = {}
+        stats = {}
+        for font_root, paths in font_paths.items():
+            if font_root not in self.cache:  # 更新缓存时才载入全部字体信息
+                self.cache[font_root] = self.cachestores[font_root].load()
+            caches[font_root] = {}
+            for font_path in paths:
+                try:
+                    stat = os.stat(font_path)
+                except OSError as e:
+                    self.log(f"字体读取错误：{e}")
+                    continue
+                entry = self.cache[font_root].get(font_path)
+                if (
+                    entry is not None
+                    and entry["size"] == stat.st_size
+                    and entry["mtime"] == stat.st_mtime
+                ):
+                    caches[font_root][font_path] = entry
+                    continue
+                stats[font_path] = (font_root, stat)
+        results = self.readfonts(list(stats))
+        for font_path, faces in results.items():
+            font_root, stat = stats[font_path]
+            caches[font_root][font_path] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "faces": faces,
+            }
+        for font_root, cache in caches.items():
+            removed = len(set(self.cache[font_root]) - set(cache))
+            read = sum(stats[font_path][0] == font_root for font_path in results)
+            self.cache[font_root] = cache
+            self.fontindex[font_root] = buildfontindex(cache)
+            self.signatures[font_root] = signatures[font_root]
+            self.log(
+                f"字体缓存更新：{font_root} 共 {len(cache)} 个字体文件，"
+                f"读取 {read} 个，移除 {removed} 个"
+            )
+            skipped = len(font_paths[font_root]) - len(cache)
+            if skipped > 0:
+                # 有字体未能记录（读取超时等）时不保存签名，下次更新缓存时再检查这个文件夹
+                self.signatures[font_root] = ""
+                self.log(f"※{skipped} 个字体未能读取，下次更新缓存时重试")
+
+        self.setusecache(True)
+
+    # 读取字体信息缓存（每个字体文件夹单独缓存）
+    def getcache(self, init: bool = False):
+        self.fontroots = self.getfontroots()
+        self.cachestores = {}
+        for font_root in self.fontroots:
+            cache_id = hashlib.sha1(os.path.normcase(font_root).encode()).hexdigest()
+            if self.getconfig("fontcache_format") == "sqlite":
+                store = FontCacheDB(self.cache_dir / f"{cache_id[:16]}.db")
+            else:
+                store = FontCacheJSON(
+                    self.cache_dir / f"{cache_id[:16]}.json",
+                    self.cache_dir / f"{cache_id[:16]}.index.json",
+                )
+            self.cachestores[font_root] = store
+        self.migratecache()
+        self.cache = {}  # 字体信息在更新缓存时才载入
+        self.fontindex = {}
+        self.signatures = {}
+        if not any(store.exists() for store in self.cachestores.values()):
+            if init:
+                self.setusecache(False)
+
+    # 将旧版的单个字体缓存文件（data/cache.db 或 data/cache.json）拆分到各字体文件夹的缓存
+    def migratecache(self):
+        for legacystore in (
+            FontCacheDB(self.cachedb_file),
+            FontCacheJSON(self.cache_file, self.fontindex_file),
+        ):
+            if not legacystore.exists():
+                continue
+            cache = legacystore.load()
+            for font_root, store in self.cachestores.items():
+                if store.exists():
+                    continue
+                prefix = os.path.normcase(os.path.join(font_root, ""))
+                fonts = {
+                    font_path: entry
+                    for font_path, entry in cache.items()
+                    if os.path.normcase(font_path).startswith(prefix)
+                }
+                if len(fonts) > 0:  # 签名留空，下次更新时逐个检查字体文件
+                    store.save(fonts, buildfontindex(fonts))
+            legacystore.remove()
+            self.log(f"字体缓存已迁移：{legacystore.cache_file}")
+
+    # 保存字体信息（只保存更新过的字体文件夹）
+    def savecache(self):
+        for font_root, fontindex in self.fontindex.items():
+            self.cachestores[font_root].save(
+                self.cache[font_root], fontindex, self.signatures[font_root]
+            )
+        self.fontindex = {}
+        self.signatures = {}
+
+    # 初始化程序设置
+    def initconfig(self, _return: bool = False):
+        config = {
+            "mkvmerge_path": "D:/path/to/mkvmerge.exe",
+            "filename_ext": "[{res}P][WEBRip][HEVC 10bit]",
+            "mkvoutputdir": "",
+            "videotrack_lang": "ja",
+            "videotrack_name": "WEBRip by KyokuSaiYume",
+            "audiotrack_delay": "0",
+            "audiotrack_lang": "ja",
+            "audiotrack_name": "WEB-DL",
+            "asschsjpntrack_symbol": "[CHS_JPN]",
+            "asschsjpntrack_lang": "zh",
+            "asschsjpntrack_name": "简日双语-CHS_JPN",
+            "asschtjpntrack_symbol": "[CHT_JPN]",
+            "asschtjpntrack_lang": "zh",
+            "asschtjpntrack_name": "繁日雙語-CHT_JPN",
+            "assjpntrack_symbol": "[JPN]",
+            "assjpntrack_lang": "ja",
+            "assjpntrack_name": "日本語-JPN",
+            "assengtrack_symbol": "[ENG]",
+            "assengtrack_lang": "en",
+            "assengtrack_name": "English-ENG",
+            "asstrackname_separator": " - ",
+            "assmultistyle_defaulttrack": "kawaii",
+            "fontsubset_warning": "请勿安装此子集化字体 - ",
+            "clean_scriptinfo": True,
+            "clean_garbage": True,
+            "clean_furigana": True,
+            "clean_space": True,
+            "clean_all_space": False,
+            "unicode_to_utf8": True,
+            "scriptinfo": "[Script Info]\nScriptType: v4.00+\nPlayResX: 1920\nPlayResY: 1080\nLayoutResX: 1920\nLayoutResY: 1080\nWrapStyle: 0\nScaledBorderAndShadow: yes\nYCbCr Matrix: TV.709\nOriginal Script: 極彩花夢\nLanguage: {LANGUAGE}",
+            "scriptinfo_language": "CHS_JPN,CHT_JPN,JPN",
+            # "assstyles": {},
+            "optional_styles": "Sx-en,Ex-lrc | op_jp,Ex-lrc | op_zh,Ex-lrc | op_en,Ex-lrc | ed_jp,Ex-lrc | ed_zh,Ex-lrc | ed_en",
+            "generate_cht": True,
+            "generate_cht_styles": "Sx-zh,Rx-annotation",
+            "generate_cht_keep_comment": True,
+            "zhconvert_json": '{"text":"{ASSCONTENT}","apiKey":"","ignoreTextStyles":"Ex-KSY,Ex-invisible","jpTextStyles":"Sx-jp,*noAutoJpTextStyles","jpTextConversionStrategy":"protectOnlySameOrigin","jpStyleConversionStrategy":"protectOnlySameOrigin","modules":"{\\"ChineseVariant\\":\\"0\\",\\"Computer\\":\\"0\\",\\"EllipsisMark\\":\\"0\\",\\"EngNumFWToHW\\":\\"0\\",\\"GanToZuo\\":\\"-1\\",\\"Gundam\\":\\"0\\",\\"HunterXHunter\\":\\"0\\",\\"InternetSlang\\":\\"-1\\",\\"Mythbusters\\":\\"0\\",\\"Naruto\\":\\"0\\",\\"OnePiece\\":\\"0\\",\\"Pocketmon\\":\\"0\\",\\"ProperNoun\\":\\"-1\\",\\"QuotationMark\\":\\"0\\",\\"RemoveSpaces\\":\\"0\\",\\"Repeat\\":\\"-1\\",\\"RepeatAutoFix\\":\\"-1\\",\\"Smooth\\":\\"-1\\",\\"TengTong\\":\\"0\\",\\"TransliterationToTranslation\\":\\"0\\",\\"Typo\\":\\"-1\\",\\"Unit\\":\\"-1\\",\\"VioletEvergarden\\":\\"0\\"}","userPostReplace":"","userPreReplace":"","userProtectReplace":"","diffCharLevel":0,"diffContextLines":1,"diffEnable":0,"diffIgnoreCase":0,"diffIgnoreWhiteSpaces":0,"diffTemplate":"Inline","cleanUpText":0,"ensureNewlineAtEof":0,"translateTabsToSpaces":-1,"trimTrailingWhiteSpaces":0,"unifyLeadingHyphen":0,"converter":"Traditional"}',
+            "zhconvert_compact": False,
+            "zhconvertcache": True,
+            "zhconvertcache_size": "256",
+            "generate_jpn": True,
+            "jpn_convert": False,
+            "jpn_convert_styles_to_delete": "Sx-zh,Rx-annotation",
+            "generate_multistyle": True,
+            "generate_karaoke": True,
+            "generate_language": "CHS_JPN,CHT_JPN,JPN",
+            "aegisub_cli_path": "D:/path/to/aegisub-cli.exe",
+            "aegisub_cli_loglevel": "2",
+            "font_dirs": "",
+            "font_system_dirs": True,
+            "font_project_dirname": "fonts",
+            "fontcache_format": "sqlite",
+            "fontcache_parallel": True,
+            "fontcache_workers": "0",
+            "fontcache_timeout": "60",
+            "subset_parallel": True,
+            "subset_workers": "0",
+            "subsetcache": True,
+            "subsetcache_size": "1024",
+            "subset_flavor": "ttf",
+            "subset_flavor_threshold": "512",
+            "asscollect_parallel": True,
+            "asscollect_workers": "0",
+            "asscache": True,
+            "asscache_size": "2000",
+            "batch_workers": "2",
+            "batch_sharedsubset": False,
+            "http_connect_timeout": "10",
+            "http_read_timeout": "120",
+            "http_retries": "3",
+            "http_backoff": "1",
+            "http_concurrency": "2",
+            "proxy": "0",
+        }
+        if _return:
+            return config
+        self.config = config
+        self.saveconfig()
+
+    # 读取程序设置
+    def setconfig(self):
+        if os.path.exists(self.config_file):
+            with open(self.config_file, "r", encoding="utf-8-sig") as json_file:
+                self.config = json.load(json_file)
+        else:
+            self.initconfig()
+
+    # 获取程序设置
+    def getconfig(self, key):
+        if key in self.overrides:  # 命令行中临时覆盖的设置
+            return self.overrides[key]
+        if key == "assstyles":
+            if len(self.assstyles) != 0:
+                return self.assstyles
+            else:
+                assstyles = {}
+                for root, _, files in os.walk(self.folder / "assstyles"):
+                    for file in files:
+                        if file.endswith(".json"):
+                            assstyles[file] = os.path.join(root, file)
+                assstyles_file = self.selectassstyles(assstyles)
+                if assstyles_file is None:
+                    self.log("※样式表文件不存在")
+                    return {}
+                with open(assstyles_file, "r", encoding="utf-8-sig") as json_file:
+                    self.assstyles = json.load(json_file)
+                for _lang, _ in self.assstyles.items():
+                    for _style, _ in self.assstyles[_lang].items():
+                        if len(self.assstyles[_lang][_style]) == 0:
+                            self.assstyles[_lang][_style] = self.assstyles["CHS_JPN"][
+                                _style
+                            ]
+                return self.assstyles
+        elif key not in self.config:
+            defaultconfig = self.initconfig(_return=True)
+            mergedconfig = dict(self.config)
+            for _key, _value in defaultconfig.items():
+                if _key not in mergedconfig:
+                    mergedconfig[_key] = _value
+            self.config = mergedconfig
+            self.saveconfig()
+        return self.config[key]
+
+    # 保存程序设置
+    def saveconfig(self):
+        if not os.path.exists(self.folder / "data"):
+            os.makedirs(self.folder / "data")
+        if os.path.exists(self.config_file):
+            os.remove(self.config_file)
+        with open(self.config_file, "w", encoding="utf-8-sig") as json_file:
+            json.dump(self.config, json_file, ensure_ascii=False)
+
+    # 多进程处理使用的进程池，批量处理时各剧集共享同一个进程池
+    def processpool(self, workers: int):
+        if self.executor is not None:
+            return nullcontext(self.executor)
+        return concurrent.futures.ProcessPoolExecutor(workers)
+
+    # 子集化字体，字体较多时分给多个进程同时处理
+    # tasks 中每项为 (字体名称, 字体文件, face, 字符, 新名称, 不带扩展名的输出路径)
+    # 按 tasks 的顺序返回实际的输出路径
+    def subsetfonts(self, tasks: list[tuple]) -> list[str]:
+        flavor = self.getconfig("subset_flavor")
+        threshold = int(float(self.getconfig("subset_flavor_threshold")) * 1024)
+        subset_parallel = self.getconfig("subset_parallel")
+        workers = int(self.getconfig("subset_workers")) or os.cpu_count() or 1
+        workers = min(workers, len(tasks))
+        if not subset_parallel or workers <= 1:
+            outputpaths = []
+            for fontname, *args in tasks:
+                self.log(f"子集化字体：{fontname}")
+                outputpaths.append(subsetfont(*args, flavor, threshold))
+            return outputpaths
+
+        self.log(f"使用 {workers} 个进程子集化 {len(tasks)} 个字体")
+        with self.processpool(workers) as executor:
+            futures = {
+                executor.submit(subsetfont, *args, flavor, threshold): fontname
+                for fontname, *args in tasks
+            }
+            for index, future in enumerate(concurrent.futures.as_completed(futures)):
+                future.result()  # 子集化出错时在这里抛出
+                self.log(f"子集化完成：{futures[future]} ({index + 1}/{len(tasks)})")
+            return [future.result() for future in futures]
+
+    # 子集化结果缓存的键（字体文件、face、字符集、子集化设置及名称前缀）
+    def subsetcachekey(self, font_path: str, face: int, characters: str) -> str:
+        stat = os.stat(font_path)
+        key = [
+            os.path.normcase(os.path.abspath(font_path)),
+            stat.st_size,
+            stat.st_mtime,
+            face,
+            "".join(sorted(set(characters))),
+            SUBSET_OPTIONS,
+            self.getconfig("fontsubset_warning"),
+            self.getconfig("subset_flavor"),
+            self.getconfig("subset_flavor_threshold"),
+        ]
+        key = json.dumps(key, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    # 读取子集化结果缓存，命中时返回当时使用的子集化名称及缓存的字体文件
+    def getsubsetcache(self, cachekey: str) -> tuple[str, Path] | None:
+        if not self.getconfig("subsetcache"):
+            return None
+        meta_file = self.subsetcache_dir / f"{cachekey}.json"
+        with self.cachelock:
+            if not os.path.exists(meta_file):
+                return None
+            with open(meta_file, "r", encoding="utf-8-sig") as json_file:
+                meta = json.load(json_file)
+            name = meta["name"]
+            font_file = self.subsetcache_dir / f"{cachekey}{meta['ext']}"
+            if not os.path.exists(font_file):
+                return None
+            for path in (font_file, meta_file):
+                os.utime(path)  # 按最近使用时间清理缓存
+        return name, font_file
+
+    # 保存子集化结果到缓存
+    def savesubsetcache(self, cachekey: str, name: str, outputpath: str):
+        if not self.getconfig("subsetcache"):
+            return
+        os.makedirs(self.subsetcache_dir, exist_ok=True)
+        ext = os.path.splitext(outputpath)[1]
+        with self.cachelock:
+            shutil.copy(outputpath, self.subsetcache_dir / f"{cachekey}{ext}")
+            with open(
+                self.subsetcache_dir / f"{cachekey}.json", "w", encoding="utf-8-sig"
+            ) as json_file:
+                json.dump({"name": name, "ext": ext}, json_file, ensure_ascii=False)
+
+    # 子集化结果缓存超过设置的大小时，删除最久未使用的缓存
+    def trimsubsetcache(self):
+        if not self.getconfig("subsetcache"):
+            return
+        maxsize = float(self.getconfig("subsetcache_size")) * 1024 * 1024
+        with self.cachelock:
+            removed = trimcache(self.subsetcache_dir, maxsize)
+        if removed > 0:
+            self.log(f"清理子集化缓存：{removed} 个")
+
+    # 繁化结果缓存的键（代入字幕内容后的整个请求内容）
+    def zhconvertcachekey(self, json_data: dict) -> str:
+        key = json.dumps(json_data, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    # 读取繁化结果缓存，未命中时返回 None
+    def getzhconvertcache(self, cachekey: str) -> str | None:
+        if not self.getconfig("zhconvertcache"):
+            return None
+        cache_file = self.zhconvertcache_dir / f"{cachekey}.ass"
+        with self.cachelock:
+            if not os.path.exists(cache_file):
+                return None
+            with open(cache_file, "r", encoding="utf-8", newline="") as file:
+                text = file.read()
+            os.utime(cache_file)  # 按最近使用时间清理缓存
+        return text
+
+    # 保存繁化结果到缓存
+    def savezhconvertcache(self, cachekey: str, text: str):
+        if not self.getconfig("zhconvertcache"):
+            return
+        os.makedirs(self.zhconvertcache_dir, exist_ok=True)
+        with self.cachelock:
+            with open(
+                self.zhconvertcache_dir / f"{cachekey}.ass",
+                "w",
+                encoding="utf-8",
+                newline="",
+            ) as file:
+                file.write(text)
+
+    # 繁化结果缓存超过设置的大小时，删除最久未使用的缓存
+    def trimzhconvertcache(self):
+        if not self.getconfig("zhconvertcache"):
+            return
+        maxsize = float(self.getconfig("zhconvertcache_size")) * 1024 * 1024
+        with self.cachelock:
+            removed = trimcache(self.zhconvertcache_dir, maxsize)
+        if removed > 0:
+            self.log(f"清理繁化缓存：{removed} 个")
+
+    # 修改字幕中使用的字体名称（为子集化后的名称）并写入文件，每行只解析一次
+    def asssubsetfix(self, document: ASSDocument, outputpath: str, replacedict: dict):
+        self.asss.append(outputpath)
+        with open(outputpath, "w", encoding="utf-8-sig") as output:
+            output.writelines(rewriteass(document.lines, replacedict))
+
+    def get_resolution(self, mkv: Path) -> tuple[int, int]:
+        media_info = MediaInfo.parse(mkv)
+        for track in media_info.tracks:
+            if track.track_type == "Video":
+                return track.width, track.height
+        return None, None
+
+    # 开始，全部完成时返回 True
+    def start(self) -> bool:
+        self.log(f"当前设置：{self.values}")
+        mkv = self.mkv[0] if len(self.mkv) > 0 else ""
+        self.log(f"mkv: {mkv}")
+        self.log(f"ass: {self.files}")
+        self.updatecache()
+        return self.processfiles()
+
+    # 更新并保存字体缓存
+    def updatecache(self):
+        self.getcache()
+        if self.values["usecache"]:
+            self.log(f"使用缓存数据")
+            self.generatecache()
+        else:
+            self.log(f"读取字体……")
+            self.generatecache(force=True)
+        self.savecache()
+
+    # 处理当前的文件：字幕生成、字体处理及混流，记录各阶段用时
+    # shared 为批量处理时整季共享的子集化结果
+    def processfiles(self, shared: tuple[dict, list] | None = None) -> bool:
+        mkv = self.mkv[0] if len(self.mkv) > 0 else ""
+        # 字幕生成
+        if self.values["assgenerate"]:
+            started = time.perf_counter()
+            self.generateass()
+            self.timings["generate"] = time.perf_counter() - started
+        # 字体处理
+        real_fontpaths = self.processfonts(shared)
+        if real_fontpaths is None:
+            return False
+        # 混流
+        success = True
+        if mkv:
+            started = time.perf_counter()
+            success = self.muxmkv(mkv, real_fontpaths)
+            self.timings["mux"] = time.perf_counter() - started
+        self.resetfiles()
+        return success
+
+    # 字幕生成（生成的字幕替换原来的字幕文件列表）
+    def generateass(self):
+        self.log("开始字幕生成")
+        assgenerate = ASSGenerate(master=self)
+        self.log("读取原始字幕文件")
+        assgenerate.readfile(self.files[0])
+        self.log("清理 Script Info")
+        assgenerate.assoriginal = assgenerate.clean_scriptinfo(
+            assgenerate.assoriginal, language="CHS_JPN"
+        )
+        self.log("清理 Aegisub Project Garbage")
+        assgenerate.assoriginal = assgenerate.clean_garbage(assgenerate.assoriginal)
+        self.log("清理 furigana 及空格，Unicode 码点转换 UTF-8")
+        assgenerate.assoriginal = assgenerate.clean_content(assgenerate.assoriginal)
+        self.log("完成简中处理")
+        assgenerate.chsconfirm()
+        self.log("进行繁化")
+        assgenerate.zhconvert()
+        self.log("进行日文字幕生成")
+        assgenerate.jpconvert()
+        self.log("进行多样式生成")
+        assgenerate.generate_multistyle()
+        self.log("进行卡拉OK模板化")
+        assgenerate.generate_karaoke()
+        if len(self.eng) > 0:
+            self.log("处理英语字幕")
+            assgenerate.readengfile(self.eng[0])
+            assgenerate.assengoriginal = assgenerate.clean_scriptinfo(
+                assgenerate.assengoriginal, language="ENG"
+            )
+            assgenerate.assengoriginal = assgenerate.clean_garbage(
+                assgenerate.assengoriginal
+            )
+            assgenerate.assengoriginal = assgenerate.clean_content(
+                assgenerate.assengoriginal
+            )
+        self.log("保存生成字幕")
+        assgenerate.savefiles()
+        self.documents = assgenerate.results
+        self.files = [document.path for document in self.documents]
+
+    # 字体处理：收集字幕中的字体并子集化或复制字体文件，修改后的字幕保存到 result
+    # shared 为批量处理时整季共享的子集化结果，返回要附加的字体文件，有字体未能找到时返回 None
+    def processfonts(self, shared: tuple[dict, list] | None = None) -> list | None:
+        started = time.perf_counter()
+        if shared is None:
+            fonts = self.getassfonts()
+            self.timings["collect"] = time.perf_counter() - started
+            started = time.perf_counter()
+        if os.path.exists(self.workdir / "result"):
+            shutil.rmtree(self.workdir / "result")
+        os.makedirs(self.workdir / "result")
+        real_fontpaths = []
+        if self.values["subset"]:
+            if shared is None:
+                subset = self.subsetassfonts(fonts, self.workdir / "result")
+                if subset is None:
+                    return None
+            else:
+                self.log("使用整季共享的子集化字体")
+                subset = shared
+            replacedict, real_fontpaths = subset
+            for document in self.getdocuments():
+                filename = os.path.basename(document.path)
+                self.asssubsetfix(
+                    document, self.workdir / "result" / filename, replacedict
+                )
+            self.log(f"字幕字体处理完毕。共 {len(replacedict)} 个字体。")
+        else:
+            for document in self.getdocuments():
+                outputpath = self.workdir / "result" / os.path.basename(document.path)
+                document.save(outputpath)
+                self.asss.append(outputpath)
+            for font, _ in fonts.items():
+                self.log(f"查找字体：{font}")
+                font_path, font_file, _ = self.getfontfile(font)
+                if font_path:
+                    shutil.copy(font_path, self.workdir / "result" / font_file)
+                    real_fontpaths.append(self.workdir / "result" / font_file)
+                else:
+                    self.log(f'※"{font}" 的字体文件未能找到。')
+                    return None
+            self.log(f"字幕字体处理完毕。共 {len(fonts)} 个字体。")
+        self.timings["subset"] = time.perf_counter() - started
+        return real_fontpaths
+
+    # 子集化字体并保存到 outputdir，返回字幕中字体名称的替换表及子集化后的字体文件
+    # 有字体未能找到时返回 None
+    def subsetassfonts(self, fonts: dict, outputdir: Path) -> tuple[dict, list] | None:
+        real_fontpaths = []
+        fontsubset_warning = self.getconfig("fontsubset_warning")
+        replacedict = {}
+        tasks = []
+        subsetcachekeys = []
+        for font, content in fonts.items():
+            self.log(f"查找字体：{font}")
+            font_path, font_file, font_face = self.getfontfile(font)
+            if font_path:
+                cachekey = self.subsetcachekey(font_path, font_face, content)
+                # 批量处理时避免缓存在复制前被其他剧集替换或清理
+                with self.cachelock:
+                    name = subsetname(font, font_path, font_face, content)
+                    subsetcache = self.getsubsetcache(cachekey)
+                    if subsetcache is not None and subsetcache[0] != name:
+                        subsetcache = None  # 旧版本缓存中的随机名称
+                    replacedict[font] = f"{fontsubset_warning}{name}"
+                    real_fontpath = outputdir / f"{font} - {name}"
+                    if subsetcache is not None:
+                        self.log(f"使用子集化缓存：{font}")
+                        subsetcache_file = subsetcache[1]
+                        real_fontpath = f"{real_fontpath}{subsetcache_file.suffix}"
+                        shutil.copy(subsetcache_file, real_fontpath)
+                    else:
+                        tasks.append(
+                            (
+                                font,
+                                font_path,
+                                font_face,
+                                content,
+                                replacedict[font],
+                                real_fontpath,
+                            )
+                        )
+                        subsetcachekeys.append((cachekey, name))
+                real_fontpaths.append(real_fontpath)
+                with open(
+                    outputdir / f".{font}.txt",
+                    "w",
+                    encoding="utf-8-sig",
+                ) as file:
+                    file.write(content)
+            else:
+                self.log(f'※"{font}" 的字体文件未能找到。')
+                return None
+        outputpaths = dict(
+            zip((task[5] for task in tasks), self.subsetfonts(tasks))
+        )  # 加上实际格式的扩展名
+        real_fontpaths = [
+            outputpaths.get(real_fontpath, real_fontpath)
+            for real_fontpath in real_fontpaths
+        ]
+        for (cachekey, name), task in zip(subsetcachekeys, tasks):
+            self.savesubsetcache(cachekey, name, outputpaths[task[5]])
+        self.trimsubsetcache()
+        return replacedict, real_fontpaths
+
+    # 混流，成功时返回 True
+    def muxmkv(self, mkv: Path, real_fontpaths: list) -> bool:
+        self.asss = sorted(self.asss, key=lambda x: os.path.basename(x))
+        self.log(f"开始自动混流")
+        mkvmerge_path = self.getconfig("mkvmerge_path")
+        title = re.sub(r"\.mkv$", "", os.path.basename(mkv))
+        videotrack_resolution = self.get_resolution(mkv)
+        filename_ext = self.getconfig("filename_ext")
+        filename_ext = re.sub(r"\{res\}", str(videotrack_resolution[1]), filename_ext)
+        outputdir = self.getconfig("mkvoutputdir")
+        if len(outputdir) == 0:
+            outputdir = os.path.dirname(mkv)
+        outputfile = f"{title} {filename_ext}.mkv"
+        if title.endswith("]"):
+            outputfile = f"{title}{filename_ext}.mkv"
+        videotrack_lang: str = self.getconfig("videotrack_lang")
+        videotrack_name: str = self.getconfig("videotrack_name")
+        audiotrack_delay: str = self.getconfig("audiotrack_delay")
+        audiotrack_lang: str = self.getconfig("audiotrack_lang")
+        audiotrack_name: str = self.getconfig("audiotrack_name")
+        asschsjpntrack_symbol: str = self.getconfig("asschsjpntrack_symbol")
+        asschsjpntrack_lang: str = self.getconfig("asschsjpntrack_lang")
+        asschsjpntrack_name: str = self.getconfig("asschsjpntrack_name")
+        asschtjpntrack_symbol: str = self.getconfig("asschtjpntrack_symbol")
+        asschtjpntrack_lang: str = self.getconfig("asschtjpntrack_lang")
+        asschtjpntrack_name: str = self.getconfig("asschtjpntrack_name")
+        assjpntrack_symbol: str = self.getconfig("assjpntrack_symbol")
+        assjpntrack_lang: str = self.getconfig("assjpntrack_lang")
+        assjpntrack_name: str = self.getconfig("assjpntrack_name")
+        assengtrack_symbol: str = self.getconfig("assengtrack_symbol")
+        assengtrack_lang: str = self.getconfig("assengtrack_lang")
+        assengtrack_name: str = self.getconfig("assengtrack_name")
+        asstrackname_separator: str = self.getconfig("asstrackname_separator")
+        assmultistyle_defaulttrack: str = self.getconfig("assmultistyle_defaulttrack")
+        assmultistyle_defaulttrack = self.selectdefaulttrack(
+            set().union(*(v.keys() for v in self.assstyles.values())),
+            assmultistyle_defaulttrack,
+        )
+        fontsubset_warning: str = self.getconfig("fontsubset_warning")
+        asstrack: dict[str, list[str, str]] = {
+            asschsjpntrack_symbol: [asschsjpntrack_lang, asschsjpntrack_name],
+            asschtjpntrack_symbol: [asschtjpntrack_lang, asschtjpntrack_name],
+            assjpntrack_symbol: [assjpntrack_lang, assjpntrack_name],
+        }
+        if len(self.eng) > 0:
+            asstrack[assengtrack_symbol] = [assengtrack_lang, assengtrack_name]
+        command = [mkvmerge_path, "--ui-language", "zh_CN", "--priority", "lower"]
+        command += ["--output", os.path.join(outputdir, outputfile)]
+        command += ["--no-subtitles", "--no-attachments"]
+        command += ["--language", f"0:{videotrack_lang}"]
+        command += ["--track-name", f"0:{videotrack_name}"]
+        command += [
+            "--display-dimensions",
+            f"0:{videotrack_resolution[0]}x{videotrack_resolution[1]}",
+        ]
+        if int(audiotrack_delay) != 0:
+            command += ["--sync", f"1:{audiotrack_delay}"]
+        command += ["--language", f"1:{audiotrack_lang}"]
+        command += ["--track-name", f"1:{audiotrack_name}", "(", str(mkv), ")"]
+        asstrackorder = ""
+        for _index, ass in enumerate(self.asss):
+            asstrackorder += "," + str(_index + 1) + ":0"
+            track_lang = "zh"
+            track_name = ""
+            track_isdefault = False
+            for _symbol, _value in asstrack.items():
+                if _symbol in os.path.basename(ass):
+                    track_lang = _value[0]
+                    track_name = _value[1]
+                    is_unique = sum(_symbol in str(_item) for _item in self.asss)
+                    if is_unique < 2:
+                        track_isdefault = True
+            realtrack_name = track_name
+            assstyle = os.path.splitext(os.path.basename(ass))[0].split(".")
+            if len(assstyle) < 2:
+                assstyle = ""
+            else:
+                assstyle = assstyle[-1]
+            if len(assstyle) != 0:
+                realtrack_name = f"{realtrack_name}{asstrackname_separator}{assstyle}"
+            if assmultistyle_defaulttrack == assstyle:
+                track_isdefault = True
+            if track_lang == assengtrack_symbol:
+                track_isdefault = True
+            command += ["--language", f"0:{track_lang}"]
+            command += ["--track-name", f"0:{realtrack_name}"]
+            if not track_isdefault:
+                command += ["--default-track-flag", "0:no"]
+            command += ["(", str(ass), ")"]
+        if not fontsubset_warning.endswith(" ") and not fontsubset_warning.endswith(
+            "-"
+        ):
+            fontsubset_warning = f"{fontsubset_warning}-"
+        for real_fontpath in real_fontpaths:
+            command += [
+                "--attachment-name",
+                f"{fontsubset_warning}{os.path.basename(real_fontpath)}",
+                "--attachment-mime-type",
+                FONT_MIME_TYPES[os.path.splitext(real_fontpath)[1].lower()],
+                "--attach-file",
+                str(real_fontpath),
+            ]
+        command += ["--title", title]
+        command += [
+            "--track-order",
+            f"0:0,0:1{asstrackorder}",  # 音视频轨道及字幕轨道
+        ]
+        self.log("混流命令：")
+        self.log(subprocess.list2cmdline(command))
+        return self.runmkvmerge(command)
+
+    # 运行 mkvmerge 并等待混流完成（返回值 0 为成功，1 为有警告，2 为出错）
+    def runmkvmerge(self, command: list[str]) -> bool:
+        returncode = subprocess.run(command).returncode
+        if returncode > 1:
+            self.log(f"※混流失败：mkvmerge 返回 {returncode}")
+            return False
+        return True
+
+    # 批量处理多集，每集在 workdir/batch 下使用单独的工作文件夹，同时处理 batch_workers 集
+    # 字体缓存只更新一次，各集共享字体索引、子集化缓存及进程池，全部成功时返回 True
+    def startbatch(self, episodes: list[ASSEpisode]) -> bool:
+        self.log(f"当前设置：{self.values}")
+        self.log(f"批量处理 {len(episodes)} 集")
+        started = time.perf_counter()
+        # 字体文件夹包括每一集字幕同目录下的字体文件夹
+        self.files = [file for episode in episodes for file in episode.files]
+        self.updatecache()
+        self.timings["cache"] = time.perf_counter() - started
+        workers = int(self.getconfig("batch_workers")) or os.cpu_count() or 1
+        workers = min(workers, len(episodes))
+        processes = int(self.getconfig("subset_workers")) or os.cpu_count() or 1
+        instances = [self.episodeinstance(episode) for episode in episodes]
+        sharedsubset = self.values["subset"] and self.getconfig("batch_sharedsubset")
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            # 各集的实例在进程池创建前复制，需要分别设置
+            for assfun in [self] + instances:
+                assfun.executor = executor
+            try:
+                with concurrent.futures.ThreadPoolExecutor(workers) as threads:
+                    if sharedsubset:
+                        results = self.runsharedbatch(instances, threads)
+                    else:
+                        results = list(
+                            threads.map(lambda assfun: assfun.runepisode(), instances)
+                        )
+            finally:
+                for assfun in [self] + instances:
+                    assfun.executor = None
+        report = dict(self.timings)
+        report["total"] = time.perf_counter() - started
+        report["episodes"] = [
+            {"name": episode.name, "success": success, "timings": assfun.timings}
+            for episode, assfun, success in zip(episodes, instances, results)
+        ]
+        self.logreport(report)
+        os.makedirs(self.workdir / "batch", exist_ok=True)
+        with open(
+            self.workdir / "batch" / "report.json", "w", encoding="utf-8-sig"
+        ) as json_file:
+            json.dump(report, json_file, ensure_ascii=False, indent=2)
+        return all(result["success"] for result in report["episodes"])
+
+    # 整季共享子集化：先生成各集的字幕，再收集全部字幕的字符，每个字体只子集化一次
+    # 子集化字体保存在 workdir/batch/fonts，各集的字幕都改为使用这些字体
+    def runsharedbatch(
+        self, instances: list["ASSFun"], threads: concurrent.futures.Executor
+    ) -> list[bool]:
+        generated = list(
+            threads.map(lambda assfun: assfun.runepisode(generateonly=True), instances)
+        )
+        documents = [
+            document
+            for assfun, success in zip(instances, generated)
+            if success
+            for document in assfun.getdocuments()
+        ]
+        if len(documents) == 0:
+            return generated
+        started = time.perf_counter()
+        assfont = ASSFont()
+        for fonts in self.collectassfiles(documents):
+            assfont.mergefonts(fonts)
+        assfont.remove_duplicates()
+        self.timings["collect"] = time.perf_counter() - started
+        started = time.perf_counter()
+        fonts_dir = self.workdir / "batch" / "fonts"
+        if os.path.exists(fonts_dir):
+            shutil.rmtree(fonts_dir)
+        os.makedirs(fonts_dir)
+        shared = self.subsetassfonts(assfont.fonts, fonts_dir)
+        self.timings["subset"] = time.perf_counter() - started
+        if shared is None:
+            return [False] * len(instances)
+        return list(
+            threads.map(
+                lambda assfun, success: success and assfun.runepisode(shared),
+                instances,
+                generated,
+            )
+        )
+
+    # 批量处理中一集使用的实例，共享设置、缓存及进程池，使用单独的工作文件夹
+    def episodeinstance(self, episode: ASSEpisode) -> "ASSFun":
+        assfun = copy.copy(self)
+        assfun.workdir = self.workdir / "batch" / episode.name
+        assfun.logprefix = f"[{episode.name}] "
+        assfun.mkv = [episode.mkv] if episode.mkv is not None else []
+        assfun.files = list(episode.files)
+        assfun.documents = []
+        assfun.eng = [episode.eng] if episode.eng is not None else []
+        assfun.asss = []
+        assfun.assstyles = {}
+        assfun.values = dict(self.values)
+        assfun.values["assgenerate"] = (
+            self.values["assgenerate"] and len(episode.files) == 1
+        )  # 和界面中一样，只有一个字幕文件时才能生成
+        assfun.timings = {}
+        return assfun
+
+    # 处理批量中的一集（在线程中运行），出错时返回 False
+    # generateonly 时只进行字幕生成，shared 为整季共享的子集化结果
+    def runepisode(
+        self, shared: tuple[dict, list] | None = None, generateonly: bool = False
+    ) -> bool:
+        started = time.perf_counter()
+        try:
+            if generateonly:
+                if self.values["assgenerate"]:
+                    self.generateass()
+                    self.timings["generate"] = time.perf_counter() - started
+                    self.values["assgenerate"] = False  # 之后不再重复生成
+                success = True
+            else:
+                success = self.processfiles(shared)
+        except Exception:
+            self.log(traceback.format_exc())
+            success = False
+        self.timings["total"] = (
+            self.timings.get("total", 0.0) + time.perf_counter() - started
+        )
+        return success
+
+    # 输出批量处理的结果及各阶段用时
+    def logreport(self, report: dict):
+        stages = {
+            "generate": "字幕生成",
+            "collect": "字体收集",
+            "subset": "子集化",
+            "mux": "混流",
+            "total": "共",
+        }
+        self.log("-- 批量处理结果 --")
+        self.log(f"字体缓存：{report['cache']:.1f}s")
+        if "subset" in report:
+            self.log(
+                f"整季共享子集化：字体收集 {report['collect']:.1f}s "
+                f"子集化 {report['subset']:.1f}s"
+            )
+        for result in report["episodes"]:
+            timings = " ".join(
+                f"{name} {result['timings'][stage]:.1f}s"
+                for stage, name in stages.items()
+                if stage in result["timings"]
+            )
+            status = "完成" if result["success"] else "※失败"
+            self.log(f"{result['name']}：{status} {timings}")
+        failed = sum(not result["success"] for result in report["episodes"])
+        self.log(
+            f"共 {len(report['episodes'])} 集，失败 {failed} 集，"
+            f"用时 {report['total']:.1f}s"
+        )
+
+    # 清空文件列表
+    def resetfiles(self):
+        self.mkv = []
+        self.asss = []
+        self.files = []
+        self.documents = []
+        self.eng = []
+        self.assstyles = {}
+
+
+# 命令行模式，返回退出代码
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="ASSFun", description="ASS 字幕生成、字体子集化及混流（命令行模式）"
+    )
+    parser.add_argument("--cli", action="store_true", help="以命令行模式运行")
+    parser.add_argument("ass", nargs="*", type=Path, help="字幕文件")
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        help="批量处理：mkv 及字幕所在的文件夹，或 json 格式的剧集清单",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=Path,
+        help="生成的字幕及处理结果的保存位置（默认为程序所在文件夹）",
+    )
+    parser.add_argument("--mkv", type=Path, help="要混流的 mkv 文件")
+    parser.add_argument("--eng", type=Path, help="单独的英语字幕文件")
+    parser.add_argument(
+        "--styles", default="", help="样式表（assstyles 中的文件名或 json 文件路径）"
+    )
+    parser.add_argument(
+        "--default-track", help="默认字幕样式（默认使用 assmultistyle_defaulttrack）"
+    )
+    parser.add_argument(
+        "--generate",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="是否进行字幕生成（默认只有一个字幕文件时进行）",
+    )
+    parser.add_argument(
+        "--no-subset",
+        dest="subset",
+        action="store_false",
+        help="不子集化，直接附加原字体文件",
+    )
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="重新检查全部字体文件夹（不论文件夹是否变化），只重新读取新增或修改过的字体",
+    )
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="临时修改设置（不会保存到设置文件），可以使用多次",
+    )
+    args = parser.parse_args(argv)
+
+    if (args.batch is None) == (len(args.ass) == 0):
+        parser.error("请指定字幕文件或者使用 --batch")
+    if args.batch is not None and not os.path.exists(args.batch):
+        parser.error(f"文件不存在：{args.batch}")
+    for file in [*args.ass, args.mkv, args.eng]:
+        if file is not None and not os.path.isfile(file):
+            parser.error(f"文件不存在：{file}")
+    assfun = ASSFun()
+    if args.workdir is not None:
+        assfun.workdir = args.workdir
+    defaultconfig = assfun.initconfig(_return=True)
+    for override in args.overrides:
+        key, separator, value = override.partition("=")
+        if len(separator) == 0 or key not in defaultconfig:
+            parser.error(f"无效的设置：{override}")
+        if isinstance(defaultconfig[key], bool):
+            value = value.strip().lower() in ("1", "true", "yes", "on")
+        assfun.overrides[key] = value
+    if args.default_track is not None:
+        assfun.overrides["assmultistyle_defaulttrack"] = args.default_track
+    assfun.assstyles_name = args.styles
+    assfun.files = list(args.ass)
+    assfun.mkv = [args.mkv] if args.mkv is not None else []
+    assfun.eng = [args.eng] if args.eng is not None else []
+    assfun.values = {
+        "assgenerate": (
+            len(assfun.files) <= 1 if args.generate is None else args.generate
+        ),
+        "subset": args.subset,
+        "usecache": not args.rescan,
+    }
+    try:
+        assfun.setup()
+        if args.batch is None:
+            return 0 if assfun.start() else 1
+        episodes, unpaired = findepisodes(
+            args.batch, assfun.getconfig("assengtrack_symbol")
+        )
+        for file in unpaired:
+            assfun.log(f"※未能配对：{file}")
+        if len(episodes) == 0:
+            assfun.log("※没有可以处理的剧集")
+            return 1
+        return 0 if assfun.startbatch(episodes) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+class ASSFunUI(Tk, ASSFun):
+    def __init__(self):
+        Tk.__init__(self)
+        ASSFun.__init__(self)
+
+        ctk.set_appearance_mode("dark")
+        self.geometry("600x500")
+        self.minsize(600, 500)
+        self.title("ASSFont - KyokuSai")
+        self.iconbitmap(resource_path("favicon.ico"))
+
+        self.grid_columnconfigure([0, 1, 2], weight=1)
+
+        ctk.FontManager.load_font(resource_path("NotoSansSC-Medium.otf"))
+        self.font = ctk.CTkFont(family="NotoSansSC-Medium", size=18, weight="normal")
+        self.configwindow = None
+
+        self.style_CTkTextbox = dict(
+            text_color="#FFFFFF",
+            fg_color="#666666",
+            border_color="#FFFFFF",
+            scrollbar_button_color="#DDDDDD",
+            scrollbar_button_hover_color="#EEEEEE",
+            font=self.font,
+            wrap="none",
+            corner_radius=4,
+            border_width=2,
+            border_spacing=0,
+        )
+        self.after(10, self._create_widgets)
+        self.after(250, self._init)
+
+    def _create_widgets(self):
+        row = 0
+
+        self.mkvbox = ctk.CTkTextbox(self, height=25, **self.style_CTkTextbox)
+        self.mkvbox.grid(
+            row=row, column=0, padx=16, pady=(10, 5), sticky="ew", columnspan=3
+        )
+        self.mkvbox.drop_target_register(DND_ALL)
+        self.mkvbox.dnd_bind(
+            "<<Drop>>",
+            partial(
+                self.file_drop,
+                box=self.mkvbox,
+                format="mkv",
+                files="mkv",
+                multiple=False,
+            ),
+        )
+        self.mkvbox.insert(ctk.END, "拖入mkv文件(如果要混流)")
+        self.mkvbox.configure(state="disabled")
+        row = row + 1
+
+        self.filebox = ctk.CTkTextbox(self, height=175, **self.style_CTkTextbox)
+        self.filebox.grid(
+            row=row, column=0, padx=16, pady=(5, 5), sticky="ew", columnspan=3
+        )
+        self.filebox.drop_target_register(DND_ALL)
+        self.filebox.dnd_bind(
+            "<<Drop>>", partial(self.file_drop, box=self.filebox, files="files")
+        )
+        self.filebox.insert(ctk.END, "拖入字幕文件")
+        self.filebox.configure(state="disabled")
+        row = row + 1
+
+        self.engbox = ctk.CTkTextbox(self, height=25, **self.style_CTkTextbox)
+        self.engbox.grid(
+            row=row, column=0, padx=16, pady=(10, 5), sticky="ew", columnspan=3
+        )
+        self.engbox.drop_target_register(DND_ALL)
+        self.engbox.dnd_bind(
+            "<<Drop>>",
+            partial(
+                self.file_drop,
+                box=self.engbox,
+                format="ass",
+                files="eng",
+                multiple=False,
+            ),
+        )
+        self.engbox.insert(ctk.END, "拖入单独英语字幕文件(如果有)")
         self.engbox.configure(state="disabled")
         row = row + 1
 
@@ -1169,7 +3278,12 @@ class ASSFunUI(Tk):
             border_spacing=2,
         )
         self.button.grid(
-            row=row, column=0, padx=(16, 16), pady=(5, 10), sticky="nws", columnspan=1
+            row=row,
+            column=0,
+            padx=(16, 16),
+            pady=(5, 10),
+            sticky="nws",
+            columnspan=1,
         )
 
         self.button = ctk.CTkButton(
@@ -1207,15 +3321,7 @@ class ASSFunUI(Tk):
             print(exc_traceback)
 
         sys.excepthook = global_exception
-        self.getcache(init=True)
-        self.setconfig()
-
-        proxy_port = self.getconfig("proxy")
-        if proxy_port != "0":
-            proxy_address = f"http://127.0.0.1:{proxy_port}"
-            os.environ["HTTP_PROXY"] = proxy_address
-            os.environ["HTTPS_PROXY"] = proxy_address
-            self.log(f"使用代理：{proxy_address}")
+        self.setup()
 
     def startbythreading(self):
         def _start():
@@ -1229,16 +3335,6 @@ class ASSFunUI(Tk):
         task_thread = threading.Thread(target=_start)
         task_thread.start()
 
-    def get_assformat_by_key(self, format: str, content: str, key: str) -> str:
-        format = format.replace(" ", "").split(",")
-        index = format.index(key)
-        content = content.split(",")
-        value = content[index]
-        if key == "Text":
-            value = ",".join(content[index:])
-        value = re.sub(r"^ ", "", value)
-        return value
-
     def file_drop(
         self,
         event,
@@ -1277,213 +3373,6 @@ class ASSFunUI(Tk):
         self.logbox.configure(state="disabled")
         print(text)
 
-    def getassfonts(self) -> dict:
-        assfont = ASSFont(master=self)
-        for file in self.files:
-            self.log(f"处理文件：{file}")
-            _assfont = ASSFont(master=self)
-            _assfont.readfile(file)
-            _assfont.readstyles()
-            _assfont.readdialogues()
-            _assfont.collectfont()
-            assfont.mergefonts(_assfont.fonts)
-        assfont.remove_duplicates()
-        return assfont.fonts
-
-    # 根据字体名称获取字体文件
-    def getfontfile(self, fontname):
-        for font_path, namerecord in self.cache.items():
-            if fontname in namerecord:
-                return font_path, os.path.basename(font_path)
-        return None, None
-
-    # 生成字体信息缓存
-    def generatecache(self):
-        self.cache = {}
-
-        def getName(names, nameID, platformID, platEncID, langID=None):
-            namerecords = []
-            for namerecord in names.names:
-                if (
-                    namerecord.nameID == nameID
-                    and namerecord.platformID == platformID
-                    and namerecord.platEncID == platEncID
-                ):
-                    if langID is None or namerecord.langID == langID:
-                        namerecords.append(namerecord)
-            return namerecords
-
-        font_dir = os.path.join(os.environ.get("SystemRoot", "C:\\"), "Fonts")
-        font_paths = []
-        for root, _, files in os.walk(font_dir):  # 有一些字体是在子文件夹中
-            for file in files:
-                file_path = os.path.join(root, file)
-                font_paths.append(file_path)
-        for font_path in font_paths:
-            filename: str = os.path.basename(font_path)
-            if filename.lower().endswith((".ttf", ".otf", ".ttc")):
-                try:
-                    fonts = []
-                    if filename.lower().endswith(".ttc"):
-                        fonts = TTCollection(font_path).fonts
-                    else:
-                        font = TTFont(font_path)
-                        fonts = [font]
-                    for font in fonts:
-                        names = font["name"]
-                        names = [
-                            name.toStr()
-                            for name in [
-                                *getName(names, 1, 3, 1),
-                                *getName(names, 4, 3, 1),
-                                *getName(names, 1, 1, 25),
-                                *getName(names, 4, 3, 25),
-                            ]
-                            if name is not None
-                        ]
-                        names = list({name for name in names if name is not None})
-                        if font_path in self.cache:
-                            self.cache[font_path].extend(names)
-                        else:
-                            self.cache[font_path] = names
-                    if not filename.lower().endswith(".ttc"):
-                        font.close()
-                except Exception as e:
-                    self.log(f"字体读取错误：{e}")
-
-        self.cache_check.toggle(master=self, value=True)
-        self.cache_check.getself().configure(state="normal")
-
-    # 读取字体信息缓存
-    def getcache(self, init: bool = False):
-        if os.path.exists(self.cache_file):
-            with open(self.cache_file, "r", encoding="utf-8-sig") as json_file:
-                self.cache = json.load(json_file)
-        else:
-            if init:
-                self.cache_check.toggle(master=self, value=False)
-                self.cache_check.getself().configure(state="disabled")
-
-    # 保存字体信息
-    def savecache(self):
-        if not os.path.exists(self.folder / "data"):
-            os.makedirs(self.folder / "data")
-        if os.path.exists(self.cache_file):
-            os.remove(self.cache_file)
-        with open(self.cache_file, "w", encoding="utf-8-sig") as json_file:
-            json.dump(self.cache, json_file, ensure_ascii=False)
-
-    # 初始化程序设置
-    def initconfig(self, _return: bool = False):
-        config = {
-            "mkvmerge_path": "D:/path/to/mkvmerge.exe",
-            "filename_ext": "[{res}P][WEBRip][HEVC 10bit]",
-            "mkvoutputdir": "",
-            "videotrack_lang": "ja",
-            "videotrack_name": "WEBRip by KyokuSaiYume",
-            "audiotrack_delay": "0",
-            "audiotrack_lang": "ja",
-            "audiotrack_name": "WEB-DL",
-            "asschsjpntrack_symbol": "[CHS_JPN]",
-            "asschsjpntrack_lang": "zh",
-            "asschsjpntrack_name": "简日双语-CHS_JPN",
-            "asschtjpntrack_symbol": "[CHT_JPN]",
-            "asschtjpntrack_lang": "zh",
-            "asschtjpntrack_name": "繁日雙語-CHT_JPN",
-            "assjpntrack_symbol": "[JPN]",
-            "assjpntrack_lang": "ja",
-            "assjpntrack_name": "日本語-JPN",
-            "assengtrack_symbol": "[ENG]",
-            "assengtrack_lang": "en",
-            "assengtrack_name": "English-ENG",
-            "asstrackname_separator": " - ",
-            "assmultistyle_defaulttrack": "kawaii",
-            "fontsubset_warning": "请勿安装此子集化字体 - ",
-            "clean_scriptinfo": True,
-            "clean_garbage": True,
-            "clean_furigana": True,
-            "clean_space": True,
-            "clean_all_space": False,
-            "unicode_to_utf8": True,
-            "scriptinfo": "[Script Info]\nScriptType: v4.00+\nPlayResX: 1920\nPlayResY: 1080\nLayoutResX: 1920\nLayoutResY: 1080\nWrapStyle: 0\nScaledBorderAndShadow: yes\nYCbCr Matrix: TV.709\nOriginal Script: 極彩花夢\nLanguage: {LANGUAGE}",
-            "scriptinfo_language": "CHS_JPN,CHT_JPN,JPN",
-            # "assstyles": {},
-            "optional_styles": "Sx-en,Ex-lrc | op_jp,Ex-lrc | op_zh,Ex-lrc | op_en,Ex-lrc | ed_jp,Ex-lrc | ed_zh,Ex-lrc | ed_en",
-            "generate_cht": True,
-            "generate_cht_styles": "Sx-zh,Rx-annotation",
-            "generate_cht_keep_comment": True,
-            "zhconvert_json": '{"text":"{ASSCONTENT}","apiKey":"","ignoreTextStyles":"Ex-KSY,Ex-invisible","jpTextStyles":"Sx-jp,*noAutoJpTextStyles","jpTextConversionStrategy":"protectOnlySameOrigin","jpStyleConversionStrategy":"protectOnlySameOrigin","modules":"{\\"ChineseVariant\\":\\"0\\",\\"Computer\\":\\"0\\",\\"EllipsisMark\\":\\"0\\",\\"EngNumFWToHW\\":\\"0\\",\\"GanToZuo\\":\\"-1\\",\\"Gundam\\":\\"0\\",\\"HunterXHunter\\":\\"0\\",\\"InternetSlang\\":\\"-1\\",\\"Mythbusters\\":\\"0\\",\\"Naruto\\":\\"0\\",\\"OnePiece\\":\\"0\\",\\"Pocketmon\\":\\"0\\",\\"ProperNoun\\":\\"-1\\",\\"QuotationMark\\":\\"0\\",\\"RemoveSpaces\\":\\"0\\",\\"Repeat\\":\\"-1\\",\\"RepeatAutoFix\\":\\"-1\\",\\"Smooth\\":\\"-1\\",\\"TengTong\\":\\"0\\",\\"TransliterationToTranslation\\":\\"0\\",\\"Typo\\":\\"-1\\",\\"Unit\\":\\"-1\\",\\"VioletEvergarden\\":\\"0\\"}","userPostReplace":"","userPreReplace":"","userProtectReplace":"","diffCharLevel":0,"diffContextLines":1,"diffEnable":0,"diffIgnoreCase":0,"diffIgnoreWhiteSpaces":0,"diffTemplate":"Inline","cleanUpText":0,"ensureNewlineAtEof":0,"translateTabsToSpaces":-1,"trimTrailingWhiteSpaces":0,"unifyLeadingHyphen":0,"converter":"Traditional"}',
-            "generate_jpn": True,
-            "jpn_convert": False,
-            "jpn_convert_styles_to_delete": "Sx-zh,Rx-annotation",
-            "generate_multistyle": True,
-            "generate_karaoke": True,
-            "generate_language": "CHS_JPN,CHT_JPN,JPN",
-            "aegisub_cli_path": "D:/path/to/aegisub-cli.exe",
-            "aegisub_cli_loglevel": "2",
-            "proxy": "0",
-        }
-        if _return:
-            return config
-        self.config = config
-        self.saveconfig()
-
-    # 读取程序设置
-    def setconfig(self):
-        if os.path.exists(self.config_file):
-            with open(self.config_file, "r", encoding="utf-8-sig") as json_file:
-                self.config = json.load(json_file)
-        else:
-            self.initconfig()
-
-    # 获取程序设置
-    def getconfig(self, key):
-        if key == "assstyles":
-            if len(self.assstyles) != 0:
-                return self.assstyles
-            else:
-                assstyles = {}
-                for root, _, files in os.walk(self.folder / "assstyles"):
-                    for file in files:
-                        if file.endswith(".json"):
-                            assstyles[file] = os.path.join(root, file)
-                if len(assstyles) == 0:
-                    self.log("※样式表文件不存在")
-                    return {}
-                _select = SelectWindow(
-                    self,
-                    title="选择样式表",
-                    selects=[assstyle for assstyle, _ in assstyles.items()],
-                )
-                assstyles_file = assstyles[_select.get_result()]
-                with open(assstyles_file, "r", encoding="utf-8-sig") as json_file:
-                    self.assstyles = json.load(json_file)
-                for _lang, _ in self.assstyles.items():
-                    for _style, _ in self.assstyles[_lang].items():
-                        if len(self.assstyles[_lang][_style]) == 0:
-                            self.assstyles[_lang][_style] = self.assstyles["CHS_JPN"][
-                                _style
-                            ]
-                return self.assstyles
-        elif key not in self.config:
-            defaultconfig = self.initconfig(_return=True)
-            mergedconfig = dict(self.config)
-            for _key, _value in defaultconfig.items():
-                if _key not in mergedconfig:
-                    mergedconfig[_key] = _value
-            self.config = mergedconfig
-            self.saveconfig()
-        return self.config[key]
-
-    # 保存程序设置
-    def saveconfig(self):
-        if not os.path.exists(self.folder / "data"):
-            os.makedirs(self.folder / "data")
-        if os.path.exists(self.config_file):
-            os.remove(self.config_file)
-        with open(self.config_file, "w", encoding="utf-8-sig") as json_file:
-            json.dump(self.config, json_file, ensure_ascii=False)
-
     # 打开设置窗口
     def openconfigwindow(self):
         if self.configwindow is None or not self.configwindow.winfo_exists():
@@ -1491,328 +3380,61 @@ class ASSFunUI(Tk):
         else:
             self.configwindow.focus()
 
-    # 子集化字体
-    def subset(
-        self,
-        fontname: str,
-        fontfile: str,
-        characters: str,
-        newname: str,
-        outputpath: str,
-    ):
-        subsetoptions = subset.Options(
-            name_languages="*",
-            # recalc_timestamp=True,
+    # 选择样式表
+    def selectassstyles(self, assstyles: dict[str, str]) -> str | None:
+        if len(assstyles) == 0:
+            return None
+        _select = SelectWindow(
+            self,
+            title="选择样式表",
+            selects=[assstyle for assstyle, _ in assstyles.items()],
         )
-        if fontfile.lower().endswith(".ttc"):
-            ttc = TTCollection(fontfile)
-            ttfs = ttc.fonts
-            for ttf in ttfs:
-                names = ttf["name"]
-                names = [
-                    names.getName(1, 3, 1),
-                    names.getName(4, 3, 1),
-                    names.getName(1, 1, 25),
-                    names.getName(4, 1, 25),
-                ]
-                names = [name.toStr() for name in names if name is not None]
-                if fontname in names:
-                    fontfile = io.BytesIO()
-                    ttf.save(fontfile)
-                    fontfile.seek(0)
-                    break
-        font = subset.load_font(fontfile, options=subsetoptions)  # 读取字体
-
-        # 子集化字体
-        subsetter = subset.Subsetter(options=subsetoptions)
-        subsetter.populate(text=characters)
-        subsetter.subset(font)
-
-        # 修改字体名称
-        name_table = font["name"]
-        for record in name_table.names:
-            if record.nameID == 1:
-                record.string = newname.encode("utf-16be")
-            elif record.nameID == 4:
-                record.string = newname.encode("utf-16be")
-
-        # 转为ttf保存
-        font.flavor = "woff2"
-        subset.save_font(font, outputpath, subset.Options())
-        font.close()
-
-    # 修改字幕中使用的字体名称（为子集化后的名称）
-    def asssubsetfix(self, filepath: str, outputpath: str, replacedict: dict):
-        self.asss.append(outputpath)
-        with open(filepath, "r", encoding="utf-8-sig") as file:
-            file_content = file.read()
-
-        part1 = re.search(r"([\s\S]+)\n\[Events\]\n", file_content, re.MULTILINE)
-        part1 = part1.group(1)
-        part2 = re.search(r"\n\[Events\]\n([\s\S]+)", file_content, re.MULTILINE)
-        part2 = part2.group(1)
-        for key in sorted(replacedict, key=lambda n: len(n), reverse=True):
-            part1 = part1.replace(key, replacedict[key])
-            part2 = part2.replace(f"\\fn{key}", f"\\fn{replacedict[key]}")
-            file_content = f"{part1}\n[Events]\n{part2}"
+        return assstyles[_select.get_result()]
 
-        with open(outputpath, "w", encoding="utf-8-sig") as file:
-            file.write(file_content)
+    # 选择默认字幕样式
+    def selectdefaulttrack(self, selects: set[str], default: str) -> str:
+        _select = SelectWindow(
+            self,
+            title="选择默认字幕样式",
+            selects=selects,
+            default=default,
+        )
+        return _select.get_result()
 
-    def get_resolution(self, mkv: Path) -> tuple[int, int]:
-        media_info = MediaInfo.parse(mkv)
-        for track in media_info.tracks:
-            if track.track_type == "Video":
-                return track.width, track.height
-        return None, None
+    def setusecache(self, value: bool):
+        self.cache_check.toggle(master=self, value=value)
+        self.cache_check.getself().configure(state="normal" if value else "disabled")
 
-    # 开始
-    def start(self):
-        self.log(f"当前设置：{self.values}")
-        mkv = self.mkv[0] if len(self.mkv) > 0 else ""
-        self.log(f"mkv: {mkv}")
-        self.log(f"ass: {self.files}")
-        if self.values["usecache"]:
-            self.log(f"使用缓存数据")
-            self.getcache()
-        else:
-            self.log(f"读取字体……")
-            self.generatecache()
-            self.savecache()
-        # 字幕生成
-        if self.values["assgenerate"]:
-            self.log("开始字幕生成")
-            assgenerate = ASSGenerate(master=self)
-            self.log("读取原始字幕文件")
-            assgenerate.readfile(self.files[0])
-            self.log("清理 Script Info")
-            assgenerate.assoriginal = assgenerate.clean_scriptinfo(
-                assgenerate.assoriginal, language="CHS_JPN"
-            )
-            self.log("清理 Aegisub Project Garbage")
-            assgenerate.assoriginal = assgenerate.clean_garbage(assgenerate.assoriginal)
-            self.log("清理 furigana")
-            assgenerate.assoriginal = assgenerate.clean_furigana(
-                assgenerate.assoriginal
-            )
-            self.log("清理空格")
-            assgenerate.assoriginal = assgenerate.clean_space(assgenerate.assoriginal)
-            self.log("Unicode 码点转换 UTF-8")
-            assgenerate.assoriginal = assgenerate.unicode_to_utf8(
-                assgenerate.assoriginal
-            )
-            self.log("完成简中处理")
-            assgenerate.chsconfirm()
-            self.log("进行繁化")
-            assgenerate.zhconvert()
-            self.log("进行日文字幕生成")
-            assgenerate.jpconvert()
-            self.log("进行多样式生成")
-            assgenerate.generate_multistyle()
-            self.log("进行卡拉OK模板化")
-            assgenerate.generate_karaoke()
-            if len(self.eng) > 0:
-                self.log("处理英语字幕")
-                assgenerate.readengfile(self.eng[0])
-                assgenerate.assengoriginal = assgenerate.clean_scriptinfo(
-                    assgenerate.assengoriginal, language="ENG"
-                )
-                assgenerate.assengoriginal = assgenerate.clean_garbage(
-                    assgenerate.assengoriginal
-                )
-                assgenerate.assengoriginal = assgenerate.clean_furigana(
-                    assgenerate.assengoriginal
-                )
-                assgenerate.assengoriginal = assgenerate.clean_space(
-                    assgenerate.assengoriginal
-                )
-                assgenerate.assengoriginal = assgenerate.unicode_to_utf8(
-                    assgenerate.assengoriginal
-                )
-            self.log("保存生成字幕")
-            assgenerate.savefiles()
-            self.files = assgenerate.results
-        # 字体处理
-        fonts = self.getassfonts()
-        if os.path.exists(self.folder / "result"):
-            shutil.rmtree(self.folder / "result")
-        os.makedirs(self.folder / "result")
-        real_fontpaths = []
-        if self.values["subset"]:
-            fontsubset_warning = self.getconfig("fontsubset_warning")
-            replacedict = {}
-            for font, content in fonts.items():
-                self.log(f"查找字体：{font}")
-                font_path, font_file = self.getfontfile(font)
-                if font_path:
-                    self.log(f"子集化字体：{font}")
-                    randomstr = "".join(
-                        random.choice(
-                            "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-                        )
-                        for _ in range(8)
-                    )
-                    replacedict[font] = f"{fontsubset_warning}{randomstr}"
-                    real_fontpath = self.folder / "result" / f"{font} - {randomstr}.ttf"
-                    self.subset(
-                        font,
-                        font_path,
-                        content,
-                        replacedict[font],
-                        real_fontpath,
-                    )
-                    real_fontpaths.append(real_fontpath)
-                    with open(
-                        self.folder / "result" / f".{font}.txt",
-                        "w",
-                        encoding="utf-8-sig",
-                    ) as file:
-                        file.write(content)
-                else:
-                    self.log(f'※"{font}" 的字体文件未能找到。')
-                    return
-            for file in self.files:
-                filename = os.path.basename(file)
-                self.asssubsetfix(file, self.folder / "result" / filename, replacedict)
-            self.log(f"字幕字体处理完毕。共 {len(fonts)} 个字体。")
-        else:
-            self.asss = self.files
-            for font, _ in fonts.items():
-                self.log(f"查找字体：{font}")
-                font_path, font_file = self.getfontfile(font)
-                if font_path:
-                    shutil.copy(font_path, self.folder / "result" / font_file)
-                    real_fontpaths.append(self.folder / "result" / font_file)
-                else:
-                    self.log(f'※"{font}" 的字体文件未能找到。')
-                    return
-            self.log(f"字幕字体处理完毕。共 {len(fonts)} 个字体。")
-        # 混流
-        if mkv:
-            self.asss = sorted(self.asss, key=lambda x: os.path.basename(x))
-            self.log(f"开始自动混流")
-            mkvmerge_path = self.getconfig("mkvmerge_path")
-            title = re.sub(r"\.mkv$", "", os.path.basename(mkv))
-            videotrack_resolution = self.get_resolution(mkv)
-            filename_ext = self.getconfig("filename_ext")
-            filename_ext = re.sub(
-                r"\{res\}", str(videotrack_resolution[1]), filename_ext
-            )
-            outputdir = self.getconfig("mkvoutputdir")
-            if len(outputdir) == 0:
-                outputdir = os.path.dirname(mkv)
-            if not outputdir.endswith("\\"):
-                outputdir = f"{outputdir}\\"
-            outputfile = f"{title} {filename_ext}.mkv"
-            if title.endswith("]"):
-                outputfile = f"{title}{filename_ext}.mkv"
-            videotrack_lang: str = self.getconfig("videotrack_lang")
-            videotrack_name: str = self.getconfig("videotrack_name")
-            audiotrack_delay: str = self.getconfig("audiotrack_delay")
-            audiotrack_lang: str = self.getconfig("audiotrack_lang")
-            audiotrack_name: str = self.getconfig("audiotrack_name")
-            asschsjpntrack_symbol: str = self.getconfig("asschsjpntrack_symbol")
-            asschsjpntrack_lang: str = self.getconfig("asschsjpntrack_lang")
-            asschsjpntrack_name: str = self.getconfig("asschsjpntrack_name")
-            asschtjpntrack_symbol: str = self.getconfig("asschtjpntrack_symbol")
-            asschtjpntrack_lang: str = self.getconfig("asschtjpntrack_lang")
-            asschtjpntrack_name: str = self.getconfig("asschtjpntrack_name")
-            assjpntrack_symbol: str = self.getconfig("assjpntrack_symbol")
-            assjpntrack_lang: str = self.getconfig("assjpntrack_lang")
-            assjpntrack_name: str = self.getconfig("assjpntrack_name")
-            assengtrack_symbol: str = self.getconfig("assengtrack_symbol")
-            assengtrack_lang: str = self.getconfig("assengtrack_lang")
-            assengtrack_name: str = self.getconfig("assengtrack_name")
-            asstrackname_separator: str = self.getconfig("asstrackname_separator")
-            assmultistyle_defaulttrack: str = self.getconfig(
-                "assmultistyle_defaulttrack"
-            )
-            _select = SelectWindow(
-                self,
-                title="选择默认字幕样式",
-                selects=set().union(*(v.keys() for v in self.assstyles.values())),
-                default=assmultistyle_defaulttrack,
-            )
-            assmultistyle_defaulttrack = _select.get_result()
-            fontsubset_warning: str = self.getconfig("fontsubset_warning")
-            asstrack: dict[str, list[str, str]] = {
-                asschsjpntrack_symbol: [asschsjpntrack_lang, asschsjpntrack_name],
-                asschtjpntrack_symbol: [asschtjpntrack_lang, asschtjpntrack_name],
-                assjpntrack_symbol: [assjpntrack_lang, assjpntrack_name],
-            }
-            if len(self.eng) > 0:
-                asstrack[assengtrack_symbol] = [assengtrack_lang, assengtrack_name]
-            cmd = f'start "mkvmux" "{mkvmerge_path}" --ui-language zh_CN --priority lower '
-            cmd += f'--output ^"{outputdir}{outputfile}^" '
-            cmd += f"--no-subtitles --no-attachments "
-            cmd += f'--language 0:{videotrack_lang} --track-name ^"0:{videotrack_name}^" --display-dimensions 0:{videotrack_resolution[0]}x{videotrack_resolution[1]} '
-            if int(audiotrack_delay) == 0:
-                audiotrack_delay = ""
-            else:
-                audiotrack_delay = f"--sync 1:{audiotrack_delay} "
-            cmd += f'{audiotrack_delay}--language 1:{audiotrack_lang} --track-name ^"1:{audiotrack_name}^" ^"^(^" ^"{mkv}^" ^"^)^" '
-            asstrackorder = ""
-            for _index, ass in enumerate(self.asss):
-                asstrackorder += "," + str(_index + 1) + ":0"
-                track_lang = "zh"
-                track_name = ""
-                track_isdefault = "--default-track-flag 0:no "
-                for _symbol, _value in asstrack.items():
-                    if _symbol in os.path.basename(ass):
-                        track_lang = _value[0]
-                        track_name = _value[1]
-                        is_unique = sum(_symbol in str(_item) for _item in self.asss)
-                        if is_unique < 2:
-                            track_isdefault = ""
-                realtrack_name = track_name
-                assstyle = os.path.splitext(os.path.basename(ass))[0].split(".")
-                if len(assstyle) < 2:
-                    assstyle = ""
-                else:
-                    assstyle = assstyle[-1]
-                if len(assstyle) != 0:
-                    realtrack_name = (
-                        f"{realtrack_name}{asstrackname_separator}{assstyle}"
-                    )
-                if assmultistyle_defaulttrack == assstyle:
-                    track_isdefault = ""
-                if track_lang == assengtrack_symbol:
-                    track_isdefault = ""
-                cmd += f'--language 0:{track_lang} --track-name ^"0:{realtrack_name}^" {track_isdefault}^"^(^" ^"{ass}^" ^"^)^" '
-            if not fontsubset_warning.endswith(" ") and not fontsubset_warning.endswith(
-                "-"
-            ):
-                fontsubset_warning = f"{fontsubset_warning}-"
-            for real_fontpath in real_fontpaths:
-                cmd += f'--attachment-name ^"{fontsubset_warning}{os.path.basename(real_fontpath)}^" --attachment-mime-type font/{os.path.splitext(real_fontpath)[1][1:].lower()} --attach-file ^"{real_fontpath}^" '
-            cmd += f'--title ^"{title}^" '
-            cmd += f"--track-order 0:0,0:1"  # 音视频轨道
-            cmd += asstrackorder  # 字幕轨道
-            self.log("混流命令：")
-            self.log(cmd)
-            os.system(cmd)
-        self.mkv = []
+    # 在新的控制台窗口中混流，不等待混流完成
+    def runmkvmerge(self, command: list[str]) -> bool:
+        subprocess.Popen(
+            command, creationflags=getattr(subprocess, "CREATE_NEW_CONSOLE", 0)
+        )
+        return True
+
+    # 清空文件列表及输入框
+    def resetfiles(self):
+        ASSFun.resetfiles(self)
         self.mkvbox.configure(state="normal")
         self.mkvbox.delete(1.0, ctk.END)
         self.mkvbox.insert(ctk.END, "拖入mkv文件(如果要混流)")
         self.mkvbox.yview(ctk.END)
         self.mkvbox.configure(state="disabled")
-        self.asss = []
-        self.files = []
         self.filebox.configure(state="normal")
         self.filebox.delete(1.0, ctk.END)
         self.filebox.insert(ctk.END, "拖入字幕文件")
         self.filebox.yview(ctk.END)
         self.filebox.configure(state="disabled")
-        self.eng = []
         self.engbox.configure(state="normal")
         self.engbox.delete(1.0, ctk.END)
         self.engbox.insert(ctk.END, "拖入单独英语字幕文件(如果有)")
         self.engbox.yview(ctk.END)
         self.engbox.configure(state="disabled")
-        self.assstyles = {}
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if HEADLESS:
+        sys.exit(main())
     ui = ASSFunUI()
     ui.mainloop()